@@ -11,13 +11,69 @@
 # <bitbar.abouturl>https://github.com/Phlooo/</bitbar.abouturl>
 
 
-# Get info
-power_source=( $(pmset -g batt | awk 'FNR == 1 {print $4$NF}' ) )
-battery_level=( $(pmset -g batt | awk -F"\t" 'FNR == 2 {print $2}' | grep -o '[0-9]\+' ) )
-battery_status=( $(pmset -g batt | awk -F";" 'FNR == 2 {print $2}') )
-remaining_time=( $(pmset -g batt | awk -F";" 'FNR == 2 {print $3}') )
-batt_condition=( $(system_profiler SPPowerDataType | grep "Condition" | awk '{print $2}') )
-batt_cycles=( $(system_profiler SPPowerDataType | grep "Cycle Count" | awk '{print $3}') )
+# Commands the probes run; override them to replay recorded output, e.g.
+# PMSET_CMD="cat pmset.txt" SYSTEM_PROFILER_CMD="cat profile.txt"
+PMSET_CMD=${PMSET_CMD:-"pmset -g batt"}
+SYSTEM_PROFILER_CMD=${SYSTEM_PROFILER_CMD:-"system_profiler SPPowerDataType"}
+
+# Condition and cycle count barely change but system_profiler takes about a
+# second, so they are cached for this many seconds and refreshed in the
+# background
+SLOW_TTL=${SLOW_TTL:-3600}
+
+plugin_dir=${0%/*}
+if [ "$plugin_dir" = "$0" ]; then plugin_dir=.; fi
+cache_dir=${HOMEBAR_CACHE_DIR:-"$plugin_dir/.cache"}
+slow_cache="$cache_dir/battery-slow.txt"
+
+now=${EPOCHSECONDS:-$(date +%s)}
+
+# Write the slow fields: fetch time, condition, cycle count
+write_slow_cache() {
+	mkdir -p "$cache_dir" &&
+		printf '%s\n%s\n%s\n' "$1" "$2" "$3" > "$slow_cache.$$" &&
+		mv -f "$slow_cache.$$" "$slow_cache"
+}
+
+refresh_slow_cache() {
+	local profile line condition cycles
+	profile=$($SYSTEM_PROFILER_CMD) || return
+	while IFS= read -r line; do
+		case $line in
+			*"Condition:"*) if [ -z "$condition" ]; then condition=( ${line#*:} ); fi ;;
+			*"Cycle Count:"*) if [ -z "$cycles" ]; then cycles=( ${line#*:} ); fi ;;
+		esac
+	done <<< "$profile"
+	write_slow_cache "${EPOCHSECONDS:-$(date +%s)}" "$condition" "$cycles"
+}
+
+# Get info, from a single pmset run:
+#   Now drawing from 'AC Power'
+#    -InternalBattery-0 (id=1234)	100%; charged; 0:00 remaining present: true
+pmset_output=$($PMSET_CMD)
+{ IFS= read -r source_line; IFS= read -r battery_line; } <<< "$pmset_output"
+
+read -r -a words <<< "$source_line"
+power_source=${words[3]}${words[${#words[@]}-1]}
+
+battery_level=
+if [[ ${battery_line#*$'\t'} =~ [0-9]+ ]]; then battery_level=${BASH_REMATCH[0]}; fi
+
+IFS=';' read -r _ status_field time_field _ <<< "$battery_line"
+battery_status=( $status_field )
+remaining_time=( $time_field )
+
+if [ ! -r "$slow_cache" ]; then refresh_slow_cache; fi
+fetched_at=0
+if [ -r "$slow_cache" ]; then
+	{ read -r fetched_at; read -r batt_condition; read -r batt_cycles; } < "$slow_cache"
+fi
+if [ $((now - fetched_at)) -ge "$SLOW_TTL" ]; then
+	# Claim the refresh so the next ticks don't start their own, then let it
+	# run without holding up this one (or BitBar, which waits for stdout)
+	write_slow_cache "$now" "$batt_condition" "$batt_cycles"
+	refresh_slow_cache > /dev/null 2>&1 &
+fi
 
 # Format things
 if [ "$power_source" = "'ACPower'" ]; then
@@ -22,42 +22,141 @@
 # ---  END CONFIG  ---
 # --------------------
 
-import datetime
-import json
-import os
 import sys
-import base64
 
+from homebar import menus
+
+# While the resident daemon (python3 -m homebar.daemon) is up, print the menu
+# it already rendered instead of paying for the imports and work below
+if __name__ == "__main__" and menus.serve_resident(__file__):
+    sys.exit(0)
+
+import os
+import base64
+import math
+import time
+from urllib import parse
 
-from dotenv import load_dotenv
+from homebar import config
 
-load_dotenv(
-    dotenv_path=os.path.dirname(os.path.abspath(__file__)) + "/.credentials.env"
-)
+config.load_env(os.path.dirname(os.path.abspath(__file__)) + "/.credentials.env")
 
-try:
-    # For Python 3.x
-    from urllib.request import Request, urlopen
-except ImportError:
-    # For Python 2.x
-    from urllib2 import Request, urlopen
+from homebar import cache, client, issuestore, memo, metrics, schedule, trace
 
 DARK_MODE = os.environ.get("BitBarDarkMode")
+RESPONSE_CACHE = cache.for_plugin(__file__, ttl=300)
+SCHEDULE = schedule.Schedule(__file__)
+MEMO = memo.Memo(__file__)
+TRACE = trace.Tracer(__file__)
+METRICS = metrics.for_plugin(__file__)
 JIRA_AUTH = os.getenv("JIRA_AUTH")
 JIRA_USERNAME = os.getenv("JIRA_USERNAME")
 JIRA_BASE_URL = os.getenv("JIRA_BASE_URL")
 
 
-def execute_query():
+# Only what the menu shows; without ``fields`` Jira sends every field,
+# descriptions and all
+FIELDS = "summary,status,customfield_10600"
+
+MY_JQL = "(project=PAY OR project=DIR) AND assignee=%s" % JIRA_USERNAME
+
+# Issues are kept in a local store and only what changed since the last sync
+# is fetched, looking OVERLAP_MINUTES further back to cover clock skew.  A
+# key-only query of all of them runs every RECONCILE_SECONDS to drop issues
+# that no longer match.  Both go straight to Jira: a cached body for the same
+# URL would be from an earlier sync and miss what changed since.
+ISSUE_STORE_PATH = menus.cache_path("jira-issues.json")
+OVERLAP_MINUTES = 2
+RECONCILE_SECONDS = 3600
+
+# Jira Cloud caps maxResults at 100; later pages are fetched side by side
+PAGE_SIZE = 100
+CONCURRENCY = 4
+
+
+@TRACE.timed()
+def execute_query(start_at=0, jql=MY_JQL, fields=FIELDS, cached=True):
     headers = {
         "Authorization": "Basic "
         + base64.b64encode(JIRA_AUTH.encode("ascii")).decode(),
         "Content-Type": "application/json",
     }
-    jql = "(project=PAY%20OR%20project=DIR)%20AND%20assignee=" + JIRA_USERNAME
-    req = Request(JIRA_BASE_URL + "/rest/api/3/search?jql=%s" % jql, headers=headers)
-    body = urlopen(req).read()
-    return json.loads(body)
+    data = {
+        "jql": jql,
+        "fields": fields,
+        "maxResults": str(PAGE_SIZE),
+        "startAt": str(start_at),
+    }
+    url = JIRA_BASE_URL + "/rest/api/3/search?" + parse.urlencode(data)
+    if cached:
+        response = RESPONSE_CACHE.fetch(url, headers=headers)
+    else:
+        with METRICS.request(metrics.endpoint(url)) as sample:
+            response = client.request("GET", url, headers=headers)
+            sample.bytes = len(response.body)
+    SCHEDULE.quota_from_headers(response.headers)
+    return response
+
+
+def iter_issues(jql=MY_JQL, fields=FIELDS, cached=True, pages=None):
+    """Every matching issue, the first page's as soon as it arrives.
+
+    Each page's Response is appended to ``pages`` when it's given.
+    """
+
+    def page(start_at):
+        response = execute_query(start_at, jql=jql, fields=fields, cached=cached)
+        if pages is not None:
+            pages.append(response)
+        return response.json()
+
+    first = page(0)
+    yield from first["issues"]
+
+    # The server may hand out fewer than we asked for
+    page_size = first.get("maxResults") or len(first["issues"])
+    if not page_size:
+        return
+    starts = range(page_size, first.get("total", 0), page_size)
+    if not starts:
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        for rest in executor.map(page, starts):
+            yield from rest["issues"]
+
+
+@TRACE.timed()
+def sync_issues():
+    """Bring the local issue store up to date and return its issues."""
+    store = issuestore.IssueStore(ISSUE_STORE_PATH)
+    now = time.time()
+
+    if store.synced_at is None:
+        pages = []
+        for issue in iter_issues(pages=pages):
+            store.put(issue)
+        # A body the cache kept from before can't vouch for ``now``: show
+        # it, but leave the store for the next run to fill from Jira itself
+        if any(response.stale for response in pages):
+            return store.values()
+        store.reconciled_at = now
+    else:
+        # Relative dates sidestep the Jira user's time zone
+        minutes = math.ceil((now - store.synced_at) / 60.0) + OVERLAP_MINUTES
+        delta = '%s AND updated >= "-%dm"' % (MY_JQL, minutes)
+        for issue in iter_issues(delta, cached=False):
+            store.put(issue)
+        if now - (store.reconciled_at or 0) > RECONCILE_SECONDS:
+            keys = [issue["key"] for issue in iter_issues(fields="key", cached=False)]
+            store.retain(keys)
+            store.reconciled_at = now
+
+    store.synced_at = now
+    store.save()
+    return store.values()
 
 
 # curl --request GET \
@@ -73,7 +172,7 @@ def find_stories():
             "status": story["fields"]["status"]["name"],
             "href": JIRA_BASE_URL + "/browse/%s" % story["key"],
         }
-        for story in execute_query()["issues"]
+        for story in sync_issues()
     ]
 
 
@@ -88,8 +187,15 @@ def print_line(text, **kwargs):
     print("%s | %s" % (text, params) if kwargs.items() else text)
 
 
-if __name__ == "__main__":
+def render():
     stories = find_stories()
+    SCHEDULE.record(stories)
+    MEMO.render(stories, _draw, stories)
+    TRACE.report()
+
+
+@TRACE.timed()
+def _draw(stories):
     print_line("!%d" % len(stories))
     print_line("---")
 
@@ -104,3 +210,11 @@ if __name__ == "__main__":
         for story in items:
             print_line(story["name"], href=story["href"])
         print_line("---")
+
+
+def main():
+    SCHEDULE.run(render)
+
+
+if __name__ == "__main__":
+    main()
@@ -22,11 +22,18 @@
 # ---  END CONFIG  ---
 # --------------------
 
+import sys
+
+from homebar import menus
+
+# While the resident daemon (python3 -m homebar.daemon) is up, print the menu
+# it already rendered instead of paying for the imports and work below
+if __name__ == "__main__" and menus.serve_resident(__file__):
+    sys.exit(0)
+
 import datetime
 import os
-import codecs
 import random
-import sys
 
 DARK_MODE = os.environ.get("BitBarDarkMode")
 
@@ -42,7 +49,7 @@ def print_line(text, **kwargs):
     print(u"%s | %s" % (text, params) if kwargs.items() else text)
 
 
-if __name__ == "__main__":
+def main():
     this_year = datetime.datetime.now().year
     anniversary = datetime.datetime(2022, 8, 5)
     delta = (anniversary.date() - datetime.datetime.today().date()).days
@@ -93,3 +100,7 @@ if __name__ == "__main__":
             ]
         )
     print_line(u"%s %s" % (sym, delta))
+
+
+if __name__ == "__main__":
+    main()
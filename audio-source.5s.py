@@ -13,6 +13,7 @@
 # <bitbar.author.github> </bitbar.author.github>
 # <bitbar.image> </bitbar.image>
 # <bitbar.dependencies>python</bitbar.dependencies>
+# <swiftbar.type>streamable</swiftbar.type>
 
 # ----------------------
 # ---  BEGIN CONFIG  ---
@@ -22,11 +23,17 @@
 # ---  END CONFIG  ---
 # --------------------
 
-import datetime
-import json
-import os
 import sys
-from subprocess import check_output
+
+from homebar import menus, stream
+
+# While the resident daemon (python3 -m homebar.daemon) is up, print the menu
+# it already rendered instead of paying for the imports and work below
+if __name__ == "__main__" and not stream.enabled() and menus.serve_resident(__file__):
+    sys.exit(0)
+
+import os
+import time
 
 DARK_MODE = os.environ.get("BitBarDarkMode")
 
@@ -42,10 +49,136 @@ def print_line(text, **kwargs):
     print("%s | %s" % (text, params) if kwargs.items() else text)
 
 
-if __name__ == "__main__":
-    ans = (
-        check_output(["/usr/local/bin/SwitchAudioSource", "-c"]).decode("ascii").strip()
+class SwitchAudioSource(object):
+    """The current output device, from SwitchAudioSource (macOS)."""
+
+    command = ["/usr/local/bin/SwitchAudioSource", "-c"]
+
+    def __init__(self):
+        self.changed = None
+
+    def current(self):
+        from subprocess import check_output
+
+        return check_output(self.command).decode("ascii").strip()
+
+    def wait(self, seconds):
+        """Return once the output device changes, or after ``seconds``.
+
+        CoreAudio says when the default output changes; where it can't be
+        asked, this just polls every POLL_SECONDS.
+        """
+        if self.changed is None:
+            self.changed = _watch_default_output() or False
+        if not self.changed:
+            time.sleep(min(seconds, POLL_SECONDS))
+            return
+        self.changed.wait(seconds)
+        self.changed.clear()
+
+
+class DeviceFile(object):
+    """The current output device, read from a file; for trying this elsewhere."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def current(self):
+        with open(self.path, "r") as f:
+            return f.read().strip()
+
+    def wait(self, seconds):
+        """Return once the file is rewritten, or after ``seconds``."""
+        before = self._mtime()
+        give_up = time.monotonic() + seconds
+        while self._mtime() == before and time.monotonic() < give_up:
+            time.sleep(min(FILE_POLL_SECONDS, max(0.0, give_up - time.monotonic())))
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+
+def _fourcc(code):
+    return int.from_bytes(code.encode("ascii"), "big")
+
+
+def _watch_default_output():
+    """An Event set whenever macOS switches the default output device, or
+    None where CoreAudio isn't available."""
+    import ctypes
+    import ctypes.util
+    import threading
+
+    path = ctypes.util.find_library("CoreAudio")
+    if not path:
+        return None
+    try:
+        core_audio = ctypes.cdll.LoadLibrary(path)
+    except OSError:
+        return None
+
+    class PropertyAddress(ctypes.Structure):
+        _fields_ = [
+            ("selector", ctypes.c_uint32),
+            ("scope", ctypes.c_uint32),
+            ("element", ctypes.c_uint32),
+        ]
+
+    listener_type = ctypes.CFUNCTYPE(
+        ctypes.c_int32,
+        ctypes.c_uint32,
+        ctypes.c_uint32,
+        ctypes.POINTER(PropertyAddress),
+        ctypes.c_void_p,
     )
+    system_object = 1
+    changed = threading.Event()
+
+    # Notifications go to the main run loop unless the HAL is told to use its
+    # own thread, and this process never runs one
+    run_loop = PropertyAddress(_fourcc("rnlp"), _fourcc("glob"), 0)
+    no_run_loop = ctypes.c_void_p(None)
+    core_audio.AudioObjectSetPropertyData(
+        system_object,
+        ctypes.byref(run_loop),
+        0,
+        None,
+        ctypes.sizeof(no_run_loop),
+        ctypes.byref(no_run_loop),
+    )
+
+    def listener(object_id, count, addresses, data):
+        changed.set()
+        return 0
+
+    # Kept on the event so the callback outlives this function
+    changed.listener = listener_type(listener)
+    default_output = PropertyAddress(_fourcc("dOut"), _fourcc("glob"), 0)
+    status = core_audio.AudioObjectAddPropertyListener(
+        system_object, ctypes.byref(default_output), changed.listener, None
+    )
+    return changed if status == 0 else None
+
+
+def provider():
+    path = os.getenv("HOMEBAR_AUDIO_DEVICE_FILE")
+    return DeviceFile(path) if path else SwitchAudioSource()
+
+
+# While streaming, the menu is redrawn as soon as the device changes and at
+# least every RECHECK_SECONDS; where changes can't be watched for, the device
+# is looked at every POLL_SECONDS instead
+RECHECK_SECONDS = 600
+POLL_SECONDS = menus.interval(__file__) or 5
+FILE_POLL_SECONDS = 0.2
+PROVIDER = provider()
+
+
+def main():
+    ans = PROVIDER.current()
 
     output_type = "?"
 
@@ -60,3 +193,10 @@ if __name__ == "__main__":
     print_line("---")
 
     print_line(ans)
+
+
+if __name__ == "__main__":
+    if stream.enabled():
+        stream.run(main, lambda: RECHECK_SECONDS, sleep=PROVIDER.wait)
+    else:
+        main()
@@ -12,32 +12,34 @@
 # <bitbar.image></bitbar.image>
 # <bitbar.dependencies>python</bitbar.dependencies>
 
+import sys
+
+from homebar import menus
+
+# While the resident daemon (python3 -m homebar.daemon) is up, print the menu
+# it already rendered instead of paying for the imports and work below
+if __name__ == "__main__" and menus.serve_resident(__file__):
+    sys.exit(0)
+
+import calendar
 from datetime import datetime
-import json
 import os
-import sys
-import codecs
-import locale
-from itertools import groupby
 
-from dotenv import load_dotenv
+from homebar import config
 
-load_dotenv(
-    dotenv_path=os.path.dirname(os.path.abspath(__file__)) + "/.credentials.env"
-)
+config.load_env(os.path.dirname(os.path.abspath(__file__)) + "/.credentials.env")
 
 ACCESS_TOKEN = os.getenv("CIRCLECI_ACCESS_TOKEN")
 
-try:
-    # For Python 3.x
-    from urllib.request import Request, urlopen
-    from urllib import parse
-except ImportError:
-    # For Python 2.x
-    from urllib2 import Request, urlopen, parse
+from urllib import parse
 
+from homebar import buildstore, cache, memo, schedule, trace
 
 DARK_MODE = os.environ.get("BitBarDarkMode")
+RESPONSE_CACHE = cache.for_plugin(__file__, ttl=60)
+SCHEDULE = schedule.Schedule(__file__)
+MEMO = memo.Memo(__file__)
+TRACE = trace.Tracer(__file__)
 
 
 colors = {
@@ -54,9 +56,14 @@ class Build(object):
         self.reponame = kwargs["reponame"]
         self.job_name = kwargs["workflows"]["job_name"]
         self.committer_date = kwargs.get("committer_date") or ""
+        self.start_time = kwargs.get("start_time")
         self.build_url = kwargs["build_url"]
         self.outcome = kwargs["outcome"]
 
+    @property
+    def key(self):
+        return (self.reponame, self.branch, self.job_name)
+
     @property
     def is_running(self):
         return self.status == "running"
@@ -66,21 +73,121 @@ class Build(object):
         return self.status == "failed"
 
 
-def execute_query():
+API_URL = os.getenv("CIRCLECI_API_URL") or "https://circleci.com/api/v1.1"
+
+# Whose builds to show
+CIRCLECI_USER = os.getenv("CIRCLECI_USER") or "gcmannb"
+
+# Projects to page through on their own, as "github/org/repo" and comma
+# separated; without any, the account's recent builds are paged instead
+CIRCLECI_PROJECTS = [
+    p.strip() for p in (os.getenv("CIRCLECI_PROJECTS") or "").split(",") if p.strip()
+]
+
+# v1.1 returns at most 100 builds a page
+PAGE_SIZE = 100
+MAX_PAGES = 5
+CONCURRENCY = 4
+
+# Builds are kept in a local store; only what is newer gets fetched, and the
+# menu shows our builds that ran in the last WINDOW_DAYS
+STORE_PATH = menus.cache_path("circleci.sqlite")
+WINDOW_DAYS = 14
+
+# Jobs failing and passing on the same revision at least this often are
+# marked flaky
+FLAKY_RATE = 0.05
+
+
+@TRACE.timed()
+def _fetch_page(path, offset):
     headers = {"Accept": "application/json"}
     data = {
         "circle-token": ACCESS_TOKEN,
-        "limit": "60",
+        "limit": str(PAGE_SIZE),
+        "offset": str(offset),
         "shallow": "true",
     }
-    req = Request(
-        "https://circleci.com/api/v1.1/recent-builds?" + parse.urlencode(data),
+    # Busy polls come more often than the cache's ttl, so they skip it
+    response = RESPONSE_CACHE.fetch(
+        API_URL + path + "?" + parse.urlencode(data),
         headers=headers,
+        ttl=0 if SCHEDULE.busy else None,
     )
-    body = urlopen(req).read()
-    result = json.loads(body)
-    result = [Build(**b) for b in result if b["user"]["login"] == "gcmannb"]
-    return result
+    SCHEDULE.quota_from_headers(response.headers)
+    return response.json()
+
+
+def _fetch_builds(path, floors, unfinished):
+    """Builds from ``path`` newer than the store has, newest first.
+
+    Stops at the last page, after MAX_PAGES, or at a page ending in a build
+    at or below its repo's floor (see BuildStore.floors), but only once the
+    pages have gone back as far as every repo's oldest unfinished build: in
+    /recent-builds one repo's builds can bury another's.
+    """
+    builds = []
+    waiting = set(unfinished)
+    for page_number in range(MAX_PAGES):
+        page = _fetch_page(path, page_number * PAGE_SIZE)
+        builds.extend(page)
+        for build in page:
+            if build["build_num"] <= unfinished.get(build["reponame"], -1):
+                waiting.discard(build["reponame"])
+        if len(page) < PAGE_SIZE:
+            break
+        oldest = page[-1]
+        if not waiting and oldest["build_num"] <= floors.get(oldest["reponame"], -1):
+            break
+    return builds
+
+
+def _paged_repos(path, repos):
+    """The ones of ``repos`` whose builds ``path`` lists."""
+    if path == "/recent-builds":
+        return repos
+    return {name: value for name, value in repos.items() if path.endswith("/" + name)}
+
+
+@TRACE.timed()
+def execute_query():
+    paths = ["/project/" + project for project in CIRCLECI_PROJECTS] or [
+        "/recent-builds"
+    ]
+    from concurrent.futures import ThreadPoolExecutor
+
+    store = buildstore.BuildStore(STORE_PATH)
+    try:
+        floors = store.floors()
+        unfinished = store.unfinished()
+        with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+            for builds in executor.map(
+                lambda p: _fetch_builds(p, floors, _paged_repos(p, unfinished)),
+                paths,
+            ):
+                store.add(builds)
+        store.prune()
+        store.commit()
+        return [Build(**b) for b in store.latest(CIRCLECI_USER, WINDOW_DAYS)]
+    finally:
+        store.close()
+
+
+@TRACE.timed()
+def job_stats(builds):
+    """{(reponame, job_name): (p50 ms, p95 ms, flake rate)} from the store."""
+    store = buildstore.BuildStore(STORE_PATH)
+    try:
+        return {
+            key: (
+                store.duration(*key, percentile=50),
+                store.duration(*key, percentile=95),
+                store.flake_rate(*key),
+            )
+            for key in {(b.reponame, b.job_name) for b in builds}
+        }
+    finally:
+        store.close()
 
 
 def execute_gh_query():
@@ -92,9 +199,9 @@ def print_line(text, **kwargs):
     print("%s | %s" % (text, params) if kwargs.items() else text)
 
 
-def _summarize(builds):
+def _summarize(builds, index):
     build_count = len([b for b in builds if b.is_running])
-    any_failures = "🔺" if any(_recent_failures(builds)) else ""
+    any_failures = "🔺" if any(index.failures()) else ""
     print_line(
         "🚧 %(build_count)s %(any_failures)s"
         % {"build_count": build_count, "any_failures": any_failures}
@@ -102,47 +209,71 @@ def _summarize(builds):
     print_line("---")
 
 
-def _recent_failures(builds):
-    for branch, branch_grouping in _sorted_then_grouped(builds, key=lambda i: i.branch):
-        for job, job_grouping in _sorted_then_grouped(
-            branch_grouping, key=lambda i: i.job_name
-        ):
-            for b in sorted(
-                job_grouping,
-                reverse=True,
-                key=lambda i: (i.committer_date),
-            )[0:1]:
-                if b.is_failed:
-                    yield b
+class BuildIndex(object):
+    """Newest build per (reponame, branch, job_name), built in one pass."""
 
+    def __init__(self, builds=()):
+        self.latest = {}
+        for build in builds:
+            self.add(build)
 
-def _print_details(builds):
-    for branch, branch_grouping in _sorted_then_grouped(builds, key=lambda i: i.branch):
-        print_line(branch_grouping[0].reponame.upper(), size=10)
-        print_line(branch)
-        for job, job_grouping in _sorted_then_grouped(
-            branch_grouping, key=lambda i: i.job_name
-        ):
-            for b in sorted(
-                job_grouping,
-                reverse=True,
-                key=lambda i: (i.committer_date),
-            )[0:1]:
-                args = dict()
-                args["status"] = b.status
-                args["job_name"] = b.job_name
-                args["outcome"] = _map_outcome(b.outcome)
-                args["ago"] = pretty_date(b.committer_date)
-                print_line(
-                    "  %(job_name)s: %(status)s %(outcome)s %(ago)s" % args,
-                    trim=False,
-                    href=b.build_url,
-                )
-        print_line("---")
+    def add(self, build):
+        key = build.key
+        current = self.latest.get(key)
+        if current is None or build.committer_date > current.committer_date:
+            self.latest[key] = build
+
+    def failures(self):
+        return [b for b in self.latest.values() if b.is_failed]
+
+    def branches(self):
+        """((reponame, branch), newest build per job) in display order."""
+        grouped = {}
+        for (reponame, branch, job_name), build in self.latest.items():
+            grouped.setdefault((reponame, branch), []).append(build)
+        return [
+            (key, sorted(grouped[key], key=lambda b: b.job_name))
+            for key in sorted(grouped, key=lambda k: (k[1], k[0]))
+        ]
+
+
+def _minutes(millis):
+    return "%dm" % round(millis / 60000.0)
 
 
-def _sorted_then_grouped(items, key=None):
-    return [(k, list(g)) for k, g in groupby(sorted(list(items), key=key), key=key)]
+def _job_notes(build, stats):
+    p50, p95, flake_rate = stats.get((build.reponame, build.job_name), (None,) * 3)
+    notes = []
+    if build.is_running and p50 and build.start_time:
+        started = datetime.fromisoformat(build.start_time.rstrip("Z"))
+        done_at = calendar.timegm(started.timetuple()) + p50 / 1000.0
+        notes.append(
+            "~%s left (p95 %s)" % (memo.token("left", "%d" % done_at), _minutes(p95))
+        )
+    if flake_rate is not None and flake_rate >= FLAKY_RATE:
+        notes.append("flaky %d%%" % round(flake_rate * 100))
+    return notes
+
+
+def _print_details(index, stats=None):
+    for (reponame, branch), builds in index.branches():
+        print_line(reponame.upper(), size=10)
+        print_line(branch)
+        for b in builds:
+            args = dict()
+            args["status"] = b.status
+            args["job_name"] = b.job_name
+            args["outcome"] = _map_outcome(b.outcome)
+            args["ago"] = (
+                memo.token("ago", b.committer_date) if b.committer_date else ""
+            )
+            args["notes"] = "".join(" · " + n for n in _job_notes(b, stats or {}))
+            print_line(
+                "  %(job_name)s: %(status)s %(outcome)s %(ago)s%(notes)s" % args,
+                trim=False,
+                href=b.build_url,
+            )
+        print_line("---")
 
 
 def _map_outcome(status):
@@ -153,45 +284,30 @@ def _map_outcome(status):
     return status
 
 
-def pretty_date(time_str=False):
-    if not time_str:
-        return ""
-
-    time = datetime.fromisoformat(time_str[:-1])
-    now = datetime.now()
-    diff = now - time
-    second_diff = diff.seconds
-    day_diff = diff.days
-
-    if day_diff < 0:
-        return ""
-
-    if day_diff == 0:
-        if second_diff < 10:
-            return "just now"
-        if second_diff < 60:
-            return f"{second_diff} seconds ago"
-        if second_diff < 120:
-            return "a minute ago"
-        if second_diff < 3600:
-            return str(second_diff / 60) + " minutes ago"
-        if second_diff < 7200:
-            return "an hour ago"
-        if second_diff < 86400:
-            return f"{second_diff / 3600:0.0f} hours ago"
-    if day_diff == 1:
-        return "yesterday"
-    if day_diff < 7:
-        return str(day_diff) + " days ago"
-    if day_diff < 31:
-        return str(day_diff / 7) + " weeks ago"
-    if day_diff < 365:
-        return str(day_diff / 30) + " months ago"
-    return str(day_diff / 365) + " years ago"
+def render():
+    builds = execute_query()
+    SCHEDULE.record([vars(b) for b in builds], busy=any(b.is_running for b in builds))
+
+    stats = job_stats(builds)
+    MEMO.render(
+        {"builds": [vars(b) for b in builds], "stats": sorted(stats.items())},
+        _draw,
+        builds,
+        stats,
+    )
+    TRACE.report()
 
 
-if __name__ == "__main__":
-    builds = execute_query()
+@TRACE.timed()
+def _draw(builds, stats):
+    index = BuildIndex(builds)
+    _summarize(builds, index)
+    _print_details(index, stats)
 
-    _summarize(builds)
-    _print_details(builds)
+
+def main():
+    SCHEDULE.run(render)
+
+
+if __name__ == "__main__":
+    main()
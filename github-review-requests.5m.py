@@ -14,27 +14,34 @@
 # <bitbar.image>https://github-bogdal.s3.amazonaws.com/bitbar-plugins/review-requests.png</bitbar.image>
 # <bitbar.dependencies>python</bitbar.dependencies>
 
+import sys
+
+from homebar import menus
+
+# While the resident daemon (python3 -m homebar.daemon) is up, print the menu
+# it already rendered instead of paying for the imports and work below
+if __name__ == "__main__" and menus.serve_resident(__file__):
+    sys.exit(0)
+
+import calendar
 import datetime
+import itertools
 import json
 import os
-import sys
-import codecs
 import re
 import subprocess
-import locale
-import yaml
-from typing import List, Tuple
-
+import time
+from typing import Iterable, List, Tuple
 
 # ----------------------
 # ---  BEGIN CONFIG  ---
 # ----------------------
 
 
-from dotenv import load_dotenv
+from homebar import config
 
 this_directory = os.path.dirname(os.path.abspath(__file__))
-load_dotenv(dotenv_path=this_directory + "/.credentials.env")
+config.load_env(this_directory + "/.credentials.env")
 
 ACCESS_TOKEN = os.getenv("GITHUB_AUTH_TOKEN")
 GITHUB_LOGIN = os.getenv("GITHUB_USERNAME")
@@ -48,81 +55,178 @@ WIP_LABEL = ""
 # (optional) Filter the PRs by an organization, labels, etc. E.g 'org:YourOrg -label:dropped'
 FILTERS = ""
 
+# The gh executable, and how many `gh pr list` calls run at once and how long
+# (seconds) each may take; never past what's left of PHASE_DEADLINE
+GH_BIN = os.getenv("GH_BIN") or "/usr/local/bin/gh"
+GH_CONCURRENCY = 8
+GH_TIMEOUT = 20
+
+# Most open PRs fetched per active repo; gh pages through them itself
+GH_PR_LIMIT = 1000
+
+# Seconds a refresh gets; searches still running by then are shown from the
+# last refresh and marked as such
+PHASE_DEADLINE = 8
+
+# While homebar.webhook pushes PR changes, only poll this often (seconds) to
+# catch what it missed
+RECONCILE_SECONDS = 30 * 60
+
 # --------------------
 # ---  END CONFIG  ---
 # --------------------
 
-try:
-    # For Python 3.x
-    from urllib.request import Request, urlopen
-except ImportError:
-    # For Python 2.x
-    from urllib2 import Request, urlopen
-
+from homebar import (
+    cache,
+    client,
+    memo,
+    metrics,
+    orchestrate,
+    prstore,
+    recording,
+    schedule,
+    trace,
+    webhook,
+)
 
 DARK_MODE = os.environ.get("BitBarDarkMode")
-CONFIG = yaml.load(open(this_directory + "/.config.yml", "r"), Loader=yaml.SafeLoader)
+RESPONSE_CACHE = cache.for_plugin(__file__, ttl=60)
+PR_STORE = prstore.PRStore(menus.cache_path("github-prs.json"))
+SCHEDULE = schedule.Schedule(__file__)
+MEMO = memo.Memo(__file__)
+TRACE = trace.Tracer(__file__)
+METRICS = metrics.for_plugin(__file__)
+with TRACE.span("load .config.yml"):
+    CONFIG = config.load_yaml(this_directory + "/.config.yml") or {}
 
 SNOOZE_PR_LIST = CONFIG.get("snooze_prs", [])
 INFORMATIVE_REPO_LIST = CONFIG.get("informative_repos", [])
 ACTIVE_REPO_LIST = CONFIG.get("active_repos", [])
 FREEZE_FRICTION_LIST = CONFIG.get("freeze_friction", [])
+# Team review requests count as mine for these team slugs/names
+REVIEW_TEAM_LIST = CONFIG.get("review_teams", [])
+
+MY_SEARCH_QUERY = "type:pr state:open assignee:%(login)s %(filters)s"
+GRAPHQL_URL = os.getenv("GITHUB_GRAPHQL_URL") or "https://api.github.com/graphql"
+
+# Stored PR details are refetched after this many seconds even when the PR's
+# updatedAt hasn't moved (CI status and mergeability don't bump it)
+DETAIL_MAX_AGE = 30 * 60
+# GraphQL caps a connection page at 100 items and a whole query at 500,000
+# nodes; page sizes are derived from these and halved when GitHub refuses
+MAX_PAGE_SIZE = 100
+GRAPHQL_NODE_LIMIT = 500000
+# Roughly how many nodes prFields costs per PR: reviews, commits and labels
+PR_FIELDS_NODES = 10 + 1 + 100
+
+FREEZE_SEARCH_QUERY = "type:pr state:open repo:%(repo)s base:hotfix"
+SNAPSHOT_SEARCH_QUERY = "type:pr state:open %(filters)s"
+SNAPSHOT_FIELDS = ",".join(
+    [
+        "number",
+        "title",
+        "isDraft",
+        "author",
+        "url",
+        "createdAt",
+        "headRefName",
+        "mergeable",
+        "reviewDecision",
+        "reviewRequests",
+        "latestReviews",
+    ]
+)
+
+# Repos whose `gh` call failed or timed out during this run; emptied as each
+# run starts, since the resident daemon runs the plugin over and over
+GH_FAILURES = []
+
+PR_FRAGMENT = """fragment prFields on PullRequest {
+  repository {
+    nameWithOwner
+  }
+  reviews(last: 10){
+    nodes {
+      id
+      state
+      author {
+        login
+      }
+      commit {
+        id
+        oid
+        url
+      }
+    }
+  }
+  commits(last:1)  {
+    nodes {
+      id
+      url
+      commit {
+        oid
+        status {
+          state
+        }
+      }
+    }
+  }
+  author {
+    login
+  }
+  createdAt
+  number
+  isDraft
+  url
+  title
+  headRefName
+  mergeable
+  labels(first:100) {
+    nodes {
+      name
+    }
+  }
+}"""
 
-query = """{
-  search(query: "%(search_query)s", type: ISSUE, first: 100) {
+search_format = """  %(alias)s: search(query: %(search_query)s, type: ISSUE, first: %(first)d%(after)s) {
     issueCount
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
     edges {
       node {
-        ... on PullRequest {
-          repository {
-            nameWithOwner
-          }
-          reviews(last: 10){
-            nodes {
-              id
-              state
-              author {
-                login
-              }
-              commit {
-                id
-                oid
-                url
-              }
-            }
-          }
-          commits(last:1)  {
-            nodes {
-              id
-              url
-              commit {
-                oid
-                status {
-                  state
-                }
-              }
-            }
-          }
-          author {
-            login
-          }
-          createdAt
-          number
-          isDraft
-          url
-          title
-          headRefName
-          mergeable
-          labels(first:100) {
-            nodes {
-              name
-            }
-          }
-        }
+        %(selection)s
       }
     }
+  }"""
+
+# Just enough to tell whether a PR changed since it was last annotated
+KEY_SELECTION = """... on PullRequest {
+          id
+          url
+          updatedAt
+        }"""
+
+RATE_LIMIT_SELECTION = """  rateLimit {
+    cost
+    remaining
+    limit
+    resetAt
+  }"""
+
+nodes_format = """{
+  nodes(ids: %(ids)s) {
+    id
+    ...prFields
   }
-}"""
+}
+"""
+
+# Just enough to know whether a search matched anything
+EXISTS_SELECTION = """... on PullRequest {
+          url
+        }"""
 
 
 colors = {
@@ -132,7 +236,8 @@ colors = {
 }
 
 
-def execute_query(query):
+@TRACE.timed()
+def execute_query(query, cached=True):
     headers = {
         "Authorization": "bearer " + ACCESS_TOKEN,
         "Content-Type": "application/json",
@@ -140,66 +245,331 @@ def execute_query(query):
         "GraphQL-Features": "pe_mobile",
     }
     data = json.dumps({"query": query}).encode("utf-8")
-    req = Request("https://api.github.com/graphql", data=data, headers=headers)
-    body = urlopen(req).read()
-    return json.loads(body)
+    if not cached:
+        with METRICS.request(metrics.endpoint(GRAPHQL_URL)) as sample:
+            response = client.request("POST", GRAPHQL_URL, body=data, headers=headers)
+            sample.bytes = len(response.body)
+        return response.json()
+    return RESPONSE_CACHE.fetch(GRAPHQL_URL, data=data, headers=headers).json()
+
+
+class SearchBatch:
+    """Several GitHub searches sent as a single GraphQL document.
+
+    Each logical search gets its own alias; PR fields are shared through
+    the ``prFields`` fragment.  ``execute`` returns one response per alias,
+    shaped like a plain ``search`` response so ``_prs`` can consume it.
+    """
+
+    def __init__(self):
+        self.searches = []
+        self.rate_limit = None
+
+    def add(self, alias, search_query, first=100, selection="...prFields", after=None):
+        self.searches.append(
+            {
+                "alias": alias,
+                "search_query": json.dumps(search_query),
+                "first": first,
+                "selection": selection,
+                "after": ", after: %s" % json.dumps(after) if after else "",
+            }
+        )
+        return alias
+
+    def document(self):
+        blocks = "\n".join(search_format % search for search in self.searches)
+        result = "{\n%s\n%s\n}" % (blocks, RATE_LIMIT_SELECTION)
+        if any(s["selection"] == "...prFields" for s in self.searches):
+            result = result + "\n" + PR_FRAGMENT
+        return result
+
+    def execute(self):
+        if not self.searches:
+            return {}
+        response = _checked(execute_query(self.document()))
+        self.rate_limit = response["data"].get("rateLimit")
+        return {
+            s["alias"]: {"data": {"search": response["data"][s["alias"]]}}
+            for s in self.searches
+        }
 
 
-def execute_query_prs(search_query_format) -> List["PR"]:
-    search_query = search_query_format % {
+def _search_query(search_query_format):
+    return search_query_format % {
         "login": GITHUB_LOGIN,
         "filters": FILTERS,
     }
-    response = execute_query(query % {"search_query": search_query})
-    return _prs(response)
 
 
-def search_pull_requests() -> List["PR"]:
-    search_query = "type:pr state:open review-requested:%(login)s %(filters)s"
-    return _cli_execute_prs(search_query)
+def execute_query_prs(search_query_format) -> List["PR"]:
+    batch = SearchBatch()
+    alias = batch.add("prs", _search_query(search_query_format))
+    return _prs(batch.execute()[alias])
+
+
+@TRACE.timed()
+def fetch_graphql_searches():
+    """Run every GraphQL-backed search of a refresh in one round trip."""
+    batch = SearchBatch()
+    batch.add(
+        "mine",
+        _search_query(MY_SEARCH_QUERY),
+        first=MAX_PAGE_SIZE,
+        selection=KEY_SELECTION,
+    )
+    for index, repo in enumerate(FREEZE_FRICTION_LIST):
+        batch.add(
+            "freeze_%d" % index,
+            FREEZE_SEARCH_QUERY % {"repo": repo},
+            first=1,
+            selection=EXISTS_SELECTION,
+        )
+    responses = batch.execute()
+
+    if batch.rate_limit:
+        METRICS.set("homebar_graphql_cost", batch.rate_limit["cost"])
+        SCHEDULE.quota(
+            batch.rate_limit["remaining"],
+            batch.rate_limit["limit"],
+            _timestamp(batch.rate_limit["resetAt"]),
+        )
+    return responses
 
 
-def _cli_execute_prs(search_query_format) -> List["PR"]:
-    def _generator(query):
-        query = query % {
-            "login": GITHUB_LOGIN,
-            "filters": FILTERS,
-        }
+class GraphQLError(Exception):
+    def __init__(self, errors):
+        super().__init__("; ".join(e.get("message", "") for e in errors))
+        self.types = set(e.get("type") for e in errors)
+
+    @property
+    def too_big(self):
+        return bool(
+            self.types & {"MAX_NODE_LIMIT_EXCEEDED", "RESOURCE_LIMITS_EXCEEDED"}
+        )
 
-        for repo in ACTIVE_REPO_LIST:
-            proc = subprocess.run(
-                f'/usr/local/bin/gh pr list -L 20 -R "{repo}" --search "{query}" --json "title,isDraft,author,url,createdAt,headRefName,mergeable,reviewDecision"',
-                shell=True,
-                capture_output=True,
+
+def _checked(response):
+    if response.get("errors") and not response.get("data"):
+        raise GraphQLError(response["errors"])
+    return response
+
+
+def _page_size(nodes_per_item):
+    return max(1, min(MAX_PAGE_SIZE, GRAPHQL_NODE_LIMIT // nodes_per_item))
+
+
+@TRACE.timed()
+def fetch_pr_details(node_ids):
+    """Full ``prFields`` for the given PR node ids, bypassing the cache."""
+    nodes = []
+    size = _page_size(PR_FIELDS_NODES)
+    i = 0
+    while i < len(node_ids):
+        ids = node_ids[i : i + size]
+        document = nodes_format % {"ids": json.dumps(ids)} + PR_FRAGMENT
+        try:
+            response = _checked(execute_query(document, cached=False))
+        except GraphQLError as e:
+            if not e.too_big or size == 1:
+                raise
+            size = size // 2
+            continue
+        nodes.extend(node for node in response["data"]["nodes"] if node)
+        i += len(ids)
+    return nodes
+
+
+def iter_search_nodes(response, search_query, selection):
+    """Nodes of a search, following ``pageInfo.endCursor`` past the first page.
+
+    ``response`` is the first page, as returned by ``SearchBatch.execute``;
+    later pages are fetched one at a time as the caller consumes them.
+    """
+    page = response["data"]["search"]
+    size = MAX_PAGE_SIZE
+    while True:
+        for edge in page["edges"]:
+            yield edge["node"]
+
+        info = page.get("pageInfo") or {}
+        if not info.get("hasNextPage"):
+            return
+
+        while True:
+            batch = SearchBatch()
+            batch.add(
+                "page",
+                search_query,
+                first=size,
+                selection=selection,
+                after=info["endCursor"],
             )
-            for item in json.loads(proc.stdout):
-                approved = item["reviewDecision"] == "APPROVED"
-                yield PR(
-                    approved=approved,
-                    author=item["author"]["login"],
-                    created_at=parse_date(item["createdAt"]),
-                    head_ref_name=item["headRefName"],
-                    in_outbox=False,
-                    is_draft=item["isDraft"],
-                    labels=[],
-                    merge_status=item["mergeable"],
-                    number=None,
-                    repository=repo,
-                    title=item["title"],
-                    url=item["url"],
-                )
-
-    return [p for p in _generator(search_query_format)]
-
-
-def search_outbox_pull_requests() -> List["PR"]:
-    search_query = "type:pr state:open reviewed-by:%(login)s %(filters)s"
-    return _cli_execute_prs(search_query)
-
-
-def search_informative_pull_requests() -> List["PR"]:
-    search_query = f"type:pr state:open %(filters)s"
-    results = _cli_execute_prs(search_query)
+            try:
+                page = batch.execute()["page"]["data"]["search"]
+                break
+            except GraphQLError as e:
+                if not e.too_big or size == 1:
+                    raise
+                size = size // 2
+
+
+def _detail_max_age(key):
+    # A check finishing doesn't move updatedAt, so PRs waiting on one are
+    # refetched on every run; that's what the schedule's busy polls are for
+    stored = PR_STORE.get(key)
+    return 0 if stored and stored.get("pending") else DETAIL_MAX_AGE
+
+
+def iter_synced_prs(response, search_query):
+    """PRs for a key-only search; only new or changed ones get annotated.
+
+    Works a page at a time, so PRs are yielded as their page arrives.
+    """
+    nodes = iter_search_nodes(response, search_query, KEY_SELECTION)
+    while True:
+        page = list(itertools.islice(nodes, MAX_PAGE_SIZE))
+        if not page:
+            return
+
+        keys = [PR(url=node["url"]).key for node in page]
+        updated_at = {node["id"]: node["updatedAt"] for node in page}
+        changed = [
+            node["id"]
+            for key, node in zip(keys, page)
+            if PR_STORE.needs_detail(key, node["updatedAt"], _detail_max_age(key))
+        ]
+        for node in fetch_pr_details(changed):
+            pr = _annotate_pr(node)
+            PR_STORE.put(pr.key, node["id"], updated_at[node["id"]], vars(pr))
+
+        for key in keys:
+            if PR_STORE.get(key):
+                yield PR(**PR_STORE.get(key))
+
+
+@TRACE.timed()
+def _gh_pr_list(repo, query, timeout=GH_TIMEOUT):
+    METRICS.inc("homebar_gh_spawns_total")
+    with METRICS.request("gh pr list") as sample:
+        proc = recording.run(
+            [
+                GH_BIN,
+                "pr",
+                "list",
+                "-L",
+                str(GH_PR_LIMIT),
+                "-R",
+                repo,
+                "--search",
+                query,
+                "--json",
+                SNAPSHOT_FIELDS,
+            ],
+            timeout=timeout,
+        )
+        proc.check_returncode()
+        sample.bytes = len(proc.stdout)
+    return json.loads(proc.stdout)
+
+
+@TRACE.timed()
+def fetch_active_snapshot():
+    """Every open PR of every active repo, as ``(repo, item)`` pairs.
+
+    Each repo is listed once; the assigned, outbox and informative views are
+    all classified locally from this snapshot.  Repos whose gh call fails or
+    runs out of time keep what the last snapshot had for them.
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    query = _search_query(SNAPSHOT_SEARCH_QUERY)
+    # A moment short of the deadline, to hand the snapshot over in time
+    ends_at = time.monotonic() + PHASE_DEADLINE - 0.5
+    listed = {}
+    for repo, item in orchestrate.kept(__file__, SNAPSHOT):
+        listed.setdefault(repo, []).append(item)
+    lock = threading.Lock()
+
+    def in_order():
+        return [
+            (repo, item) for repo in ACTIVE_REPO_LIST for item in listed.get(repo, [])
+        ]
+
+    def list_repo(repo):
+        timeout = min(GH_TIMEOUT, ends_at - time.monotonic())
+        if timeout <= 0:
+            raise subprocess.TimeoutExpired(GH_BIN, 0)
+        items = _gh_pr_list(repo, query, timeout)
+        # Kept as each repo comes in, so a refresh that runs late (and is
+        # cut short by orchestrate.finish) still keeps the repos it listed
+        with lock:
+            listed[repo] = items
+            orchestrate.keep(__file__, SNAPSHOT, in_order())
+
+    with ThreadPoolExecutor(max_workers=GH_CONCURRENCY) as executor:
+        futures = [executor.submit(list_repo, repo) for repo in ACTIVE_REPO_LIST]
+
+    for repo, future in zip(ACTIVE_REPO_LIST, futures):
+        try:
+            future.result()
+        except (subprocess.SubprocessError, ValueError):
+            if repo not in GH_FAILURES:
+                GH_FAILURES.append(repo)
+    return in_order()
+
+
+def _cli_pr(repo, item) -> "PR":
+    return PR(
+        approved=item["reviewDecision"] == "APPROVED",
+        author=item["author"]["login"],
+        created_at=parse_date(item["createdAt"]),
+        head_ref_name=item["headRefName"],
+        in_outbox=False,
+        is_draft=item["isDraft"],
+        labels=[],
+        merge_status=item["mergeable"],
+        number=item["number"],
+        repository=repo,
+        title=item["title"],
+        url=item["url"],
+    )
+
+
+def _is_review_requested(item):
+    for request in item["reviewRequests"]:
+        if request.get("login") == GITHUB_LOGIN:
+            return True
+        if request.get("slug") in REVIEW_TEAM_LIST:
+            return True
+        if request.get("name") in REVIEW_TEAM_LIST:
+            return True
+    return False
+
+
+def _is_reviewed_by_me(item):
+    return any(
+        (review.get("author") or {}).get("login") == GITHUB_LOGIN
+        for review in item["latestReviews"]
+    )
+
+
+@TRACE.timed()
+def search_pull_requests(snapshot) -> List["PR"]:
+    return [
+        _cli_pr(repo, item) for repo, item in snapshot if _is_review_requested(item)
+    ]
+
+
+@TRACE.timed()
+def search_outbox_pull_requests(snapshot) -> List["PR"]:
+    return [_cli_pr(repo, item) for repo, item in snapshot if _is_reviewed_by_me(item)]
+
+
+@TRACE.timed()
+def search_informative_pull_requests(snapshot) -> List["PR"]:
+    results = [_cli_pr(repo, item) for repo, item in snapshot]
 
     for pr in results:
         pr.in_outbox = True
@@ -207,47 +577,32 @@ def search_informative_pull_requests() -> List["PR"]:
     return results
 
 
-def search_for_freeze_pull_requests():
-    search_query_format = """{
-      search(query: "%(search_query)s", type: ISSUE, first: 20) {
-        edges {
-          node {
-            ... on PullRequest {
-              repository {
-                nameWithOwner
-              }
-              author {
-                login
-              }
-              createdAt
-            }
-          }
-        }
-      }
-    }"""
-    frozen = []
-    for repo in FREEZE_FRICTION_LIST:
-        search_query = f"type:pr state:open repo:{repo} base:hotfix"
-
-        response = execute_query(query % {"search_query": search_query})
-        if any(response["data"]["search"]["edges"]):
-            frozen.append(repo)
+@TRACE.timed()
+def search_for_freeze_pull_requests(responses):
+    frozen = [
+        repo
+        for index, repo in enumerate(FREEZE_FRICTION_LIST)
+        if "freeze_%d" % index in responses
+        and any(responses["freeze_%d" % index]["data"]["search"]["edges"])
+    ]
     if any(frozen):
         print_line("Frozen from merging: ")
         print_line(", ".join(frozen))
         print_line("---")
 
 
-def search_my_pull_requests() -> Tuple[List["PR"], bool]:
-    search_query = "type:pr state:open assignee:%(login)s %(filters)s" % {
-        "login": GITHUB_LOGIN,
-        "filters": FILTERS,
-    }
-    response = execute_query(query % {"search_query": search_query})
+@TRACE.timed()
+def search_my_pull_requests(responses) -> Tuple[List["PR"], bool]:
+    # The webhook receiver may have saved changes since we loaded
+    PR_STORE.reload()
+    my_prs = list(iter_synced_prs(responses["mine"], _search_query(MY_SEARCH_QUERY)))
+    PR_STORE.retain([pr.key for pr in my_prs])
+    PR_STORE.save()
+    return my_prs, _mine_approved(my_prs)
 
-    approved = False
-    my_prs = _prs(response)
 
+def _mine_approved(my_prs):
+    approved = False
     for pr in my_prs:  # [r["node"] for r in response["data"]["search"]["edges"]]:
         # Don't track approval on snoozed PRs
         if pr.key in SNOOZE_PR_LIST:
@@ -256,7 +611,7 @@ def search_my_pull_requests() -> Tuple[List["PR"], bool]:
         # Consider it my court if the PR's latest commit has a review
         approved = approved or pr.approved  # _is_approved(pr)
 
-    return _prs(response), approved
+    return approved
 
 
 def parse_date(text):
@@ -264,6 +619,11 @@ def parse_date(text):
     return date_obj.strftime("%B %d, %Y")
 
 
+def _timestamp(text):
+    date_obj = datetime.datetime.strptime(text, "%Y-%m-%dT%H:%M:%SZ")
+    return calendar.timegm(date_obj.timetuple())
+
+
 def print_line(text, **kwargs):
     params = " ".join(["%s=%s" % (key, value) for key, value in kwargs.items()])
     print("%s | %s" % (text, params) if kwargs.items() else text)
@@ -278,6 +638,40 @@ def _summary(issue_count, mine_approved):
     print_line("---")
 
 
+# What each phase of a refresh fetches, for the stale notice
+PHASE_LABELS = {
+    "searches": "my PRs and freezes",
+    "mine": "my PRs",
+    "snapshot": "open PRs",
+}
+
+
+def _print_stale(stale):
+    if not stale:
+        return
+    print_line("⏱ Slow to refresh, showing earlier results for:", color="red")
+    print_line(
+        ", ".join(
+            "%s (%s)"
+            % (
+                PHASE_LABELS.get(name, name),
+                time.strftime("%H:%M", time.localtime(at)) if at else "none yet",
+            )
+            for name, at in sorted(stale.items())
+        ),
+        color=colors["subtitle"],
+        size=12,
+    )
+    print_line("---")
+
+
+def _print_failures():
+    if any(GH_FAILURES):
+        print_line("⚠ Partial results, gh failed for:", color="red")
+        print_line(", ".join(GH_FAILURES), color=colors["subtitle"], size=12)
+        print_line("---")
+
+
 class PR:
     def __init__(
         self,
@@ -293,6 +687,7 @@ class PR:
         created_at=None,
         head_ref_name=None,
         merge_status=None,
+        pending=False,
     ):
         self.repository = repository
         self.title = title
@@ -306,6 +701,7 @@ class PR:
         self.is_draft = is_draft
         self.head_ref_name = head_ref_name
         self.merge_status = merge_status
+        self.pending = pending
 
     @property
     def snoozed(self):
@@ -373,7 +769,11 @@ class PR:
         #
         mine = pr["author"]["login"] == GITHUB_LOGIN
         in_outbox = approved_by_me and not mine
-        statuses = filter(None, [n["commit"]["status"] for n in pr["commits"]["nodes"]])
+        statuses = [
+            n["commit"]["status"]
+            for n in pr["commits"]["nodes"]
+            if n["commit"]["status"]
+        ]
         failed = any(status for status in statuses if status["state"] == "FAILURE")
         pending = any(status for status in statuses if status["state"] == "PENDING")
 
@@ -402,6 +802,7 @@ class PR:
             created_at=parse_date(pr["createdAt"]),
             head_ref_name=pr["headRefName"],
             merge_status=pr["mergeable"],
+            pending=pending,
         )
 
     @property
@@ -423,7 +824,7 @@ def _prs(response):
     return [_annotate_pr(r["node"]) for r in response["data"]["search"]["edges"]]
 
 
-def _print_prs(items: List[PR]):
+def _print_prs(items: Iterable[PR]):
     outbox = []
     snoozed_items = []
     for item in items:
@@ -447,29 +848,251 @@ def _print_prs(items: List[PR]):
         my.print_it("--")
 
 
-def _actual_count(items: List[PR]) -> int:
-    return len([i for i in items if not i.snoozed])
+def _actual_count(items: Iterable[PR]) -> int:
+    return sum(1 for i in items if not i.snoozed)
 
 
-if __name__ == "__main__":
+def _unique_prs(prs, informative):
+    seen = set()
+    for p in prs:
+        if p.key not in seen:
+            seen.add(p.key)
+            yield p
+
+    for p in informative:
+        if p.key not in seen:
+            seen.add(p.key)
+            p.title = "(info) " + p.title
+            yield p
+
+
+def _dump_mine(result):
+    prs, approved = result
+    return {"prs": [vars(pr) for pr in prs], "approved": approved}
+
+
+def _load_mine(data):
+    return [PR(**pr) for pr in data["prs"]], data["approved"]
+
+
+# The GraphQL searches and the gh snapshot don't depend on each other, so
+# they run side by side; my PRs' details need the searches
+SEARCHES = orchestrate.Phase("searches", fetch_graphql_searches, default={})
+MINE = orchestrate.Phase(
+    "mine",
+    search_my_pull_requests,
+    needs=["searches"],
+    default=([], False),
+    dump=_dump_mine,
+    load=_load_mine,
+)
+SNAPSHOT = orchestrate.Phase("snapshot", fetch_active_snapshot, default=[])
+
+
+def render():
+    del GH_FAILURES[:]
+    results = orchestrate.run(
+        __file__, [SEARCHES, MINE, SNAPSHOT], deadline=PHASE_DEADLINE
+    )
+    responses = results["searches"]
+    mine, approved = results["mine"]
+    snapshot = results["snapshot"]
+
+    SCHEDULE.record(
+        {"searches": responses, "snapshot": snapshot},
+        busy=any(pr.pending for pr in mine),
+        reconcile=RECONCILE_SECONDS if webhook.running() else None,
+    )
+    _show(responses, mine, approved, snapshot, results.stale)
+    TRACE.report()
+
+
+def _show(responses, mine, approved, snapshot, stale):
+    # Details of my PRs may change without their search results changing
+    MEMO.render(
+        {
+            "mine": [vars(pr) for pr in mine],
+            "searches": responses,
+            "snapshot": snapshot,
+            "failures": GH_FAILURES,
+            "stale": stale,
+            "config": CONFIG,
+        },
+        _draw,
+        responses,
+        mine,
+        approved,
+        snapshot,
+        stale,
+    )
+
+
+@TRACE.timed()
+def _draw(responses, mine, approved, snapshot, stale):
+    outbox = search_outbox_pull_requests(snapshot)
+    assigned_to_me = search_pull_requests(snapshot)
+    total = _actual_count(mine) + _actual_count(assigned_to_me)
+
+    _summary(str(total), approved)
+    _print_stale(stale)
+    _print_failures()
+    search_for_freeze_pull_requests(responses)
+    _print_prs(
+        _unique_prs(
+            itertools.chain(mine, assigned_to_me, outbox),
+            search_informative_pull_requests(snapshot),
+        )
+    )
+
+
+# Webhook events (see homebar.webhook) are applied to what the last poll left:
+# my PRs in PR_STORE get their details fetched again, by node id, and the gh
+# snapshot is patched in place.  The menu is then redrawn from those without
+# searching; what can't be worked out from an event (a new review decision,
+# say) is left to the next reconciling poll.
+
+
+def _snapshot_item(pull, item=None):
+    """``gh pr list`` fields of a webhook's pull_request, on top of ``item``."""
+    item = dict(item or {"reviewDecision": "", "latestReviews": []})
+    requests = [
+        {"login": user["login"]} for user in pull.get("requested_reviewers", [])
+    ]
+    requests += [
+        {"slug": team.get("slug"), "name": team.get("name")}
+        for team in pull.get("requested_teams", [])
+    ]
+    item.update(
+        number=pull["number"],
+        title=pull["title"],
+        isDraft=bool(pull.get("draft")),
+        author={"login": pull["user"]["login"]},
+        url=pull["html_url"],
+        createdAt=pull["created_at"],
+        headRefName=pull["head"]["ref"],
+        mergeable={True: "MERGEABLE", False: "CONFLICTING"}.get(
+            pull.get("mergeable"), "UNKNOWN"
+        ),
+        reviewRequests=requests,
+    )
+    return item
+
+
+def _reviewed(item, review):
+    """``item`` with a pull_request_review's review applied."""
+    login = review["user"]["login"]
+    state = review["state"].upper()
+    item = dict(item)
+    item["latestReviews"] = [
+        r
+        for r in item.get("latestReviews", [])
+        if (r.get("author") or {}).get("login") != login
+    ]
+    if state != "DISMISSED":
+        item["latestReviews"].append({"author": {"login": login}, "state": state})
+    item["reviewRequests"] = [
+        r for r in item.get("reviewRequests", []) if r.get("login") != login
+    ]
+    if state in ("APPROVED", "CHANGES_REQUESTED"):
+        item["reviewDecision"] = state
+    elif state == "DISMISSED" and item.get("reviewDecision") == "APPROVED":
+        item["reviewDecision"] = "REVIEW_REQUIRED"
+    return item
+
+
+def _patch_snapshot(snapshot, event, payload):
+    """The snapshot with a pull_request(_review) event applied, or None when
+    it isn't about an active repo."""
+    pull = payload["pull_request"]
+    repo = pull["base"]["repo"]["full_name"]
+    if repo not in ACTIVE_REPO_LIST:
+        return None
+
+    patched = []
+    found = None
+    for item_repo, item in snapshot:
+        if item_repo == repo and item["number"] == pull["number"]:
+            found = item
+        else:
+            patched.append((item_repo, item))
+
+    if pull["state"] != "open":
+        return patched if found is not None else None
+    item = _snapshot_item(pull, found)
+    if event == "pull_request_review":
+        item = _reviewed(item, payload["review"])
+    patched.append((repo, item))
+    return patched
+
+
+def _mine_to_refresh(event, payload):
+    """{key: (node id, updatedAt)} of my PRs the event touches; my PRs it
+    closes or unassigns are dropped from PR_STORE."""
+    if event == "status":
+        repo = payload["repository"]["full_name"]
+        branches = set(b["name"] for b in payload.get("branches", []))
+        return {
+            key: (PR_STORE.node_id(key), PR_STORE.updated_at(key))
+            for key in PR_STORE.keys()
+            if PR_STORE.get(key)["repository"] == repo
+            and PR_STORE.get(key)["head_ref_name"] in branches
+        }
+
+    pull = payload["pull_request"]
+    key = PR(url=pull["html_url"]).key
+    assignees = [user["login"] for user in pull.get("assignees", [])]
+    if pull["state"] != "open" or GITHUB_LOGIN not in assignees:
+        PR_STORE.drop(key)
+        return {}
+    return {key: (pull["node_id"], pull["updated_at"])}
+
+
+def apply_event(event, payload):
+    """Apply a webhook event to the stored PRs and snapshot; True when the
+    menu needs redrawing."""
+    PR_STORE.reload()
+    before = set(PR_STORE.keys())
+    refresh = _mine_to_refresh(event, payload)
+    for node in fetch_pr_details([node_id for node_id, _ in refresh.values()]):
+        pr = _annotate_pr(node)
+        PR_STORE.put(pr.key, node["id"], refresh[pr.key][1], vars(pr))
+    changed = bool(refresh) or set(PR_STORE.keys()) != before
+    PR_STORE.save()
+    if changed:
+        mine = [PR(**PR_STORE.get(key)) for key in PR_STORE.keys()]
+        orchestrate.keep(__file__, MINE, (mine, _mine_approved(mine)))
+
+    if event != "status":
+        snapshot = _patch_snapshot(orchestrate.kept(__file__, SNAPSHOT), event, payload)
+        if snapshot is not None:
+            orchestrate.keep(__file__, SNAPSHOT, snapshot)
+            changed = True
+    return changed
+
+
+def render_pushed():
+    """Draw the menu from what apply_event left, without fetching."""
+    mine, approved = orchestrate.kept(__file__, MINE)
+    _show(
+        orchestrate.kept(__file__, SEARCHES),
+        mine,
+        approved,
+        orchestrate.kept(__file__, SNAPSHOT),
+        {},
+    )
+
+
+def main():
     if not all([ACCESS_TOKEN, GITHUB_LOGIN]):
         print_line("⚠ Github review requests", color="red")
         print_line("---")
         print_line("ACCESS_TOKEN and GITHUB_LOGIN cannot be empty")
         sys.exit(0)
 
-    mine, approved = search_my_pull_requests()
-    outbox = search_outbox_pull_requests()
-    assigned_to_me = search_pull_requests()
-    prs = mine + assigned_to_me + outbox
+    SCHEDULE.run(render)
 
-    pr_titles = set([p.title for p in prs])
-    for p in search_informative_pull_requests():
-        if p.title not in pr_titles:
-            prs.append(p)
-            p.title = "(info) " + p.title
-    total = _actual_count(mine) + _actual_count(assigned_to_me)
 
-    _summary(str(total), approved)
-    search_for_freeze_pull_requests()
-    _print_prs(prs)
+if __name__ == "__main__":
+    main()
+    # A phase past PHASE_DEADLINE may still be waiting on gh
+    orchestrate.finish()
@@ -0,0 +1,4 @@
+# Shared helpers for the BitBar plugins that live next to this package.
+#
+# BitBar only runs the executable files at the top of the plugin directory,
+# so modules kept in here are never picked up as plugins themselves.
@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+
+# Benchmarks for the plugins' parse and render paths, on synthetic data.
+#
+#   python3 -m homebar.bench                      # 1k, 10k and 50k items
+#   python3 -m homebar.bench --sizes 1000 --repeat 5
+#   python3 -m homebar.bench --fixtures fixtures.jsonl
+#   python3 -m homebar.bench --check-imports      # fail when over budget
+#
+# Each case reports its best wall time, items per second and peak traced
+# memory.  Cold start runs every plugin in a fresh interpreter: import only
+# by default, the whole plugin replayed from recorded fixtures (see
+# homebar.recording) when --fixtures is given.  Import cost is measured with
+# ``-X importtime`` against IMPORT_BUDGETS.  Nothing touches the network,
+# and plugin state goes to a throwaway HOMEBAR_CACHE_DIR.
+
+import argparse
+import contextlib
+import importlib.util
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from homebar import menus
+
+DEFAULT_SIZES = (1000, 10000, 50000)
+
+PLUGINS = {
+    "github": "github-review-requests.5m.py",
+    "circleci": "circleci-builds.2m.py",
+    "jira": "Story.10m.py",
+}
+
+# Enough configuration for every plugin to import without credentials
+ENVIRONMENT = {
+    "GITHUB_AUTH_TOKEN": "bench",
+    "GITHUB_USERNAME": "bench-me",
+    "CIRCLECI_ACCESS_TOKEN": "bench",
+    "JIRA_AUTH": "bench:bench",
+    "JIRA_USERNAME": "bench-me",
+    "JIRA_BASE_URL": "https://jira.invalid",
+}
+
+# Milliseconds each plugin may spend importing, over a bare interpreter's own
+# imports, going by the sum of -X importtime's self times
+IMPORT_BUDGETS = {
+    "github-review-requests.5m.py": 80,
+    "circleci-builds.2m.py": 70,
+    "Story.10m.py": 75,
+    "audio-source.5s.py": 25,
+    "pomodoro.1m.py": 25,
+}
+
+# Loads a plugin without running it
+IMPORT_PLUGIN = (
+    "import importlib.util as u, sys; "
+    "s = u.spec_from_file_location('plugin', sys.argv[1]); "
+    "s.loader.exec_module(u.module_from_spec(s))"
+)
+
+LOGINS = ["bench-me", "alice", "bob", "carol", "dependabot"]
+STATES = ["SUCCESS", "FAILURE", "PENDING"]
+
+
+def _date(rng):
+    return "2021-%02d-%02dT%02d:%02d:%02dZ" % (
+        rng.randint(1, 12),
+        rng.randint(1, 28),
+        rng.randint(0, 23),
+        rng.randint(0, 59),
+        rng.randint(0, 59),
+    )
+
+
+def github_nodes(count, seed=0):
+    """``prFields`` search nodes, as GitHub's GraphQL API returns them."""
+    rng = random.Random(seed)
+    nodes = []
+    for i in range(count):
+        repo = "org/repo-%d" % (i % 25)
+        oid = "%040x" % rng.getrandbits(160)
+        reviews = [
+            {
+                "id": "R%d_%d" % (i, r),
+                "state": rng.choice(["APPROVED", "COMMENTED", "CHANGES_REQUESTED"]),
+                "author": {"login": rng.choice(LOGINS)},
+                "commit": {"id": "C%d" % r, "oid": rng.choice([oid, "0" * 40])},
+            }
+            for r in range(rng.randint(0, 10))
+        ]
+        nodes.append(
+            {
+                "id": "PR_%d" % i,
+                "updatedAt": _date(rng),
+                "repository": {"nameWithOwner": repo},
+                "reviews": {"nodes": reviews},
+                "commits": {
+                    "nodes": [
+                        {
+                            "id": "C%d" % i,
+                            "commit": {
+                                "oid": oid,
+                                "status": {"state": rng.choice(STATES)},
+                            },
+                        }
+                    ]
+                },
+                "author": {"login": rng.choice(LOGINS)},
+                "createdAt": _date(rng),
+                "number": i,
+                "isDraft": rng.random() < 0.1,
+                "url": "https://github.com/%s/pull/%d" % (repo, i),
+                "title": "Change number %d" % i,
+                "headRefName": "branch-%d" % i,
+                "mergeable": rng.choice(["MERGEABLE", "CONFLICTING", "UNKNOWN"]),
+                "labels": {"nodes": [{"name": "label-%d" % (i % 7)}]},
+            }
+        )
+    return nodes
+
+
+def gh_items(count, seed=0):
+    """``gh pr list --json`` items for the snapshot fields."""
+    rng = random.Random(seed)
+    return [
+        {
+            "number": i,
+            "title": "Change number %d" % i,
+            "isDraft": rng.random() < 0.1,
+            "author": {"login": rng.choice(LOGINS)},
+            "url": "https://github.com/org/repo-%d/pull/%d" % (i % 25, i),
+            "createdAt": _date(rng),
+            "headRefName": "branch-%d" % i,
+            "mergeable": rng.choice(["MERGEABLE", "CONFLICTING"]),
+            "reviewDecision": rng.choice(["APPROVED", "REVIEW_REQUIRED", ""]),
+            "reviewRequests": [{"login": rng.choice(LOGINS)}],
+            "latestReviews": [{"author": {"login": rng.choice(LOGINS)}}],
+        }
+        for i in range(count)
+    ]
+
+
+def circleci_builds(count, seed=0):
+    """v1.1 ``recent-builds`` entries."""
+    rng = random.Random(seed)
+    return [
+        {
+            "build_num": count - i,
+            "status": rng.choice(["success", "failed", "running", "queued"]),
+            "outcome": rng.choice(["success", "failed", None]),
+            "branch": "branch-%d" % rng.randint(0, count // 20 + 1),
+            "reponame": "repo-%d" % rng.randint(0, 4),
+            "username": "org",
+            "vcs_type": "github",
+            "vcs_revision": "%040x" % rng.getrandbits(160),
+            "workflows": {"job_name": rng.choice(["build", "test", "lint"])},
+            "committer_date": _date(rng),
+            "start_time": _date(rng),
+            "stop_time": None,
+            "build_time_millis": rng.randint(30000, 900000),
+            "build_url": "https://circleci.com/gh/org/repo/%d" % (count - i),
+            "user": {"login": "gcmannb"},
+        }
+        for i in range(count)
+    ]
+
+
+def jira_issues(count, seed=0):
+    """``/rest/api/3/search`` issues with the fields Story.10m.py reads."""
+    rng = random.Random(seed)
+    return [
+        {
+            "key": "PAY-%d" % i,
+            "fields": {
+                "summary": "Story number %d" % i,
+                "status": {"name": rng.choice(["To Do", "In Progress", "Done"])},
+                "customfield_10600": [
+                    {"name": "Sprint %d" % rng.randint(1, 40)}
+                    for _ in range(rng.randint(0, 3))
+                ],
+            },
+        }
+        for i in range(count)
+    ]
+
+
+def load_plugin(name):
+    path = os.path.join(menus.plugin_directory(), PLUGINS[name])
+    spec = importlib.util.spec_from_file_location("bench_" + name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure(fn, repeat):
+    """Best wall time of ``repeat`` runs, and peak traced memory of one."""
+    best = None
+    with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def cases(size):
+    github = load_plugin("github")
+    circleci = load_plugin("circleci")
+    jira = load_plugin("jira")
+
+    nodes = github_nodes(size)
+    search = {"data": {"search": {"edges": [{"node": n} for n in nodes]}}}
+    prs = github._prs(search)
+    snapshot = [("org/repo", item) for item in gh_items(size)]
+    builds = [circleci.Build(**b) for b in circleci_builds(size)]
+    index = circleci.BuildIndex(builds)
+    issues = jira_issues(size)
+    jira.sync_issues = lambda: issues
+
+    return [
+        ("github PR.annotate", lambda: [github.PR.annotate(n) for n in nodes]),
+        ("github _prs", lambda: github._prs(search)),
+        ("github snapshot classify", lambda: github.search_pull_requests(snapshot)),
+        ("github _print_prs", lambda: github._print_prs(prs)),
+        ("circleci BuildIndex", lambda: circleci.BuildIndex(builds)),
+        ("circleci _summarize", lambda: circleci._summarize(builds, index)),
+        ("circleci _print_details", lambda: circleci._print_details(index)),
+        ("jira find_stories", lambda: jira.find_stories()),
+    ]
+
+
+def cold_start(name, repeat, fixtures=None):
+    path = os.path.join(menus.plugin_directory(), PLUGINS[name])
+    if fixtures:
+        argv = [sys.executable, path]
+    else:
+        argv = [sys.executable, "-c", IMPORT_PLUGIN, path]
+    env = dict(os.environ, HOMEBAR_REPLAY=fixtures or "")
+    env.pop("HOMEBAR_RECORD", None)
+
+    best = None
+    for _ in range(repeat):
+        # A cache left by the last repeat would have it skip the tick or
+        # serve the menu it drew, which isn't a cold start
+        env["HOMEBAR_CACHE_DIR"] = tempfile.mkdtemp(prefix="homebar-cold-")
+        try:
+            started = time.perf_counter()
+            subprocess.run(
+                argv,
+                cwd=menus.plugin_directory(),
+                env=env,
+                stdout=subprocess.DEVNULL,
+                check=True,
+            )
+            elapsed = time.perf_counter() - started
+        finally:
+            shutil.rmtree(env["HOMEBAR_CACHE_DIR"], ignore_errors=True)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _importtime(argv):
+    """(total self ms, [(cumulative ms, module)] of top-level imports)."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime"] + argv,
+        cwd=menus.plugin_directory(),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    total = 0
+    top = []
+    for line in proc.stderr.decode("utf-8").splitlines():
+        if not line.startswith("import time:"):
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        if not own.strip().isdigit():
+            continue
+        total += int(own)
+        # Nested imports are indented under the one that pulled them in
+        if not name[1:].startswith(" "):
+            top.append((int(cumulative) / 1000.0, name.strip()))
+    return total / 1000.0, sorted(top, reverse=True)
+
+
+def import_cost(plugin, repeat):
+    """Best import cost of ``plugin`` over a bare interpreter, and its
+    heaviest top-level imports."""
+    bare = [_importtime(["-c", IMPORT_PLUGIN.split(";")[0]]) for _ in range(repeat)]
+    base, base_top = min(bare)
+    path = os.path.join(menus.plugin_directory(), plugin)
+    total, top = min(_importtime(["-c", IMPORT_PLUGIN, path]) for _ in range(repeat))
+    ours = {name for _, name in base_top}
+    return total - base, [(ms, name) for ms, name in top if name not in ours]
+
+
+def check_imports(repeat):
+    """Print import costs against IMPORT_BUDGETS; False if any is over."""
+    within = True
+    for plugin, budget in IMPORT_BUDGETS.items():
+        cost, top = import_cost(plugin, repeat)
+        over = cost > budget
+        within = within and not over
+        heaviest = ", ".join("%s %.1f" % (name, ms) for ms, name in top[:3])
+        print(
+            "%-28s %8s %10.2f ms %12s   %s"
+            % (
+                plugin,
+                "",
+                cost,
+                "OVER %d ms" % budget if over else "<= %d ms" % budget,
+                heaviest,
+            )
+        )
+    return within
+
+
+def _row(name, size, seconds, peak):
+    rate = size / seconds if seconds else float("inf")
+    print(
+        "%-28s %8s %10.2f ms %12.0f ops/s %10.1f MiB"
+        % (name, size or "", seconds * 1000, rate, peak / 2.0**20)
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m homebar.bench")
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(s) for s in DEFAULT_SIZES),
+        help="comma separated item counts (default: %(default)s)",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--fixtures", help="JSONL recorded with HOMEBAR_RECORD, for cold start"
+    )
+    parser.add_argument(
+        "--check-imports",
+        action="store_true",
+        help="only measure import costs, and exit 1 when over budget",
+    )
+    args = parser.parse_args(argv)
+
+    for key, value in ENVIRONMENT.items():
+        os.environ.setdefault(key, value)
+    os.environ["HOMEBAR_CACHE_DIR"] = tempfile.mkdtemp(prefix="homebar-bench-")
+
+    print("%-28s %8s %13s %18s %14s" % ("case", "items", "time", "rate", "peak"))
+    within = check_imports(args.repeat)
+    if args.check_imports:
+        sys.exit(0 if within else 1)
+
+    for name in PLUGINS:
+        mode = "run" if args.fixtures else "import"
+        seconds = cold_start(name, args.repeat, fixtures=args.fixtures)
+        print("%-28s %8s %10.2f ms" % ("%s cold %s" % (name, mode), "", seconds * 1000))
+
+    for size in [int(s) for s in args.sizes.split(",")]:
+        for name, fn in cases(size):
+            seconds, peak = measure(fn, args.repeat)
+            _row(name, size, seconds, peak)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+# Local history of CircleCI builds, in SQLite.
+#
+# Every build the plugin pages through is kept here, so a tick only has to
+# fetch what is newer than the last one it saw (plus whatever was still
+# running).  The menu is answered from the store: the newest build per
+# branch and job, and per job its typical duration and how often it flakes.
+# What counts as recent, for the menu and for pruning, goes by when the build
+# itself ran (``built_at``): a rebuild of an old commit is still new.
+
+import json
+import os
+import time
+
+# Builds older than this are dropped
+RETENTION_DAYS = 90
+
+# Statuses that will still change
+UNFINISHED = ("running", "queued", "scheduled", "not_running")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS builds (
+    reponame TEXT NOT NULL,
+    build_num INTEGER NOT NULL,
+    branch TEXT,
+    job_name TEXT,
+    login TEXT,
+    status TEXT,
+    outcome TEXT,
+    vcs_revision TEXT,
+    committer_date TEXT,
+    build_time_millis INTEGER,
+    data TEXT NOT NULL,
+    built_at TEXT,
+    PRIMARY KEY (reponame, build_num)
+);
+CREATE INDEX IF NOT EXISTS builds_latest
+    ON builds (reponame, branch, job_name, committer_date);
+CREATE INDEX IF NOT EXISTS builds_duration
+    ON builds (reponame, job_name, outcome, build_time_millis);
+CREATE INDEX IF NOT EXISTS builds_revision
+    ON builds (reponame, job_name, vcs_revision, outcome);
+CREATE INDEX IF NOT EXISTS builds_status ON builds (status, reponame);
+CREATE INDEX IF NOT EXISTS builds_built_at ON builds (login, built_at);
+"""
+
+
+def _built_at(build):
+    return build.get("queued_at") or build.get("start_time") or build.get("stop_time")
+
+
+def _cutoff(days):
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(time.time() - days * 86400))
+
+
+class BuildStore(object):
+    def __init__(self, path):
+        self.path = path
+        import sqlite3
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self._migrate()
+        self.db.executescript(SCHEMA)
+
+    def _migrate(self):
+        """Bring a store from before ``built_at`` up to date."""
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(builds)")]
+        if not columns or "built_at" in columns:
+            return
+        self.db.execute("ALTER TABLE builds ADD COLUMN built_at TEXT")
+        self.db.executemany(
+            "UPDATE builds SET built_at = ? WHERE reponame = ? AND build_num = ?",
+            [
+                (_built_at(json.loads(data)), reponame, build_num)
+                for reponame, build_num, data in self.db.execute(
+                    "SELECT reponame, build_num, data FROM builds"
+                ).fetchall()
+            ],
+        )
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def floors(self):
+        """Per repo, the build number below which nothing needs fetching.
+
+        That is the newest build stored, or just below the oldest one still
+        running, so it is fetched again until it finishes.
+        """
+        floors = dict(
+            self.db.execute("SELECT reponame, MAX(build_num) FROM builds GROUP BY 1")
+        )
+        for reponame, build_num in self.unfinished().items():
+            floors[reponame] = build_num - 1
+        return floors
+
+    def unfinished(self):
+        """Per repo, the number of its oldest build that will still change."""
+        placeholders = ",".join("?" * len(UNFINISHED))
+        return dict(
+            self.db.execute(
+                "SELECT reponame, MIN(build_num) FROM builds WHERE status IN (%s) "
+                "GROUP BY 1" % placeholders,
+                UNFINISHED,
+            )
+        )
+
+    def add(self, builds):
+        """Insert or update raw v1.1 build dicts."""
+        self.db.executemany(
+            "INSERT OR REPLACE INTO builds (reponame, build_num, branch, job_name, "
+            "login, status, outcome, vcs_revision, committer_date, "
+            "build_time_millis, data, built_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    b["reponame"],
+                    b["build_num"],
+                    b.get("branch"),
+                    (b.get("workflows") or {}).get("job_name"),
+                    (b.get("user") or {}).get("login"),
+                    b.get("status"),
+                    b.get("outcome"),
+                    b.get("vcs_revision"),
+                    b.get("committer_date"),
+                    b.get("build_time_millis"),
+                    json.dumps(b),
+                    _built_at(b),
+                )
+                for b in builds
+            ],
+        )
+
+    def prune(self, days=RETENTION_DAYS):
+        # Builds without any time of their own are kept
+        self.db.execute("DELETE FROM builds WHERE built_at < ?", (_cutoff(days),))
+
+    def commit(self):
+        self.db.commit()
+
+    def latest(self, login, days):
+        """Newest build per (reponame, branch, job_name) by ``login``, of
+        those run in the last ``days`` (or with no time to go by)."""
+        # SQLite takes the bare ``data`` column from the row holding the MAX;
+        # reruns share the commit's date, so the build number breaks ties
+        rows = self.db.execute(
+            "SELECT data, "
+            "MAX(COALESCE(committer_date, '') || printf('%010d', build_num)) "
+            "FROM builds "
+            "WHERE login = ? AND (built_at >= ? OR built_at IS NULL) "
+            "GROUP BY reponame, branch, job_name",
+            (login, _cutoff(days)),
+        )
+        return [json.loads(data) for data, _ in rows]
+
+    def duration(self, reponame, job_name, percentile):
+        """Milliseconds a successful run of the job takes, at ``percentile``."""
+        where = (
+            "FROM builds WHERE reponame = ? AND job_name = ? AND outcome = 'success' "
+            "AND build_time_millis IS NOT NULL"
+        )
+        (count,) = self.db.execute(
+            "SELECT COUNT(*) " + where, (reponame, job_name)
+        ).fetchone()
+        if not count:
+            return None
+        row = self.db.execute(
+            "SELECT build_time_millis " + where + " ORDER BY build_time_millis "
+            "LIMIT 1 OFFSET ?",
+            (reponame, job_name, min(count - 1, int(count * percentile / 100.0))),
+        ).fetchone()
+        return row[0]
+
+    def flake_rate(self, reponame, job_name):
+        """Share of revisions on which the job both failed and passed."""
+        row = self.db.execute(
+            "SELECT COUNT(*), SUM(flaky) FROM ("
+            "  SELECT MAX(outcome = 'failed') AND MAX(outcome = 'success') AS flaky"
+            "  FROM builds WHERE reponame = ? AND job_name = ?"
+            "  AND outcome IN ('success', 'failed') AND vcs_revision IS NOT NULL"
+            "  GROUP BY vcs_revision"
+            ")",
+            (reponame, job_name),
+        ).fetchone()
+        revisions, flaky = row
+        return float(flaky or 0) / revisions if revisions else None
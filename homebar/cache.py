@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+
+# On-disk HTTP response cache shared by the plugins.
+#
+# Entries are keyed by a fingerprint of the request and stored as one JSON
+# file each under ``<plugin dir>/.cache/responses`` (see menus.cache_path).
+# A fresh entry is served without touching the network.  A stale one is
+# revalidated first (with If-None-Match / If-Modified-Since when the API handed
+# out validators), but only for STALE_DEADLINE seconds: when the API is slower
+# than that the stale body is served and a detached process finishes the
+# revalidation, so the next tick picks up the new body.  When the network is
+# down the last good body is served instead of failing.
+
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import time
+
+from homebar import client, menus, metrics
+
+# A revalidation lock older than this (seconds) is assumed abandoned
+REVALIDATE_TIMEOUT = 60
+
+# Seconds a stale entry's revalidation may hold up a fetch before the stale
+# body is served instead
+STALE_DEADLINE = 5
+
+
+def fingerprint(url, data=None, headers=None):
+    digest = hashlib.sha256()
+    digest.update(("POST " if data is not None else "GET ").encode("utf-8"))
+    digest.update(url.encode("utf-8"))
+    for key, value in sorted((headers or {}).items()):
+        digest.update(("\n%s: %s" % (key.lower(), value)).encode("utf-8"))
+    digest.update(b"\n\n")
+    digest.update(data or b"")
+    return digest.hexdigest()
+
+
+def _request(url, data=None, headers=None, deadline=None):
+    try:
+        return client.request(
+            "GET" if data is None else "POST",
+            url,
+            body=data,
+            headers=headers,
+            deadline=deadline,
+        )
+    except client.HTTPError as e:
+        if e.code != 304:
+            raise
+        return e.response
+
+
+class _NoMetrics(object):
+    @contextlib.contextmanager
+    def request(self, name):
+        yield metrics.Sample()
+
+    def inc(self, name, labels=None, value=1):
+        pass
+
+
+class ResponseCache(object):
+    def __init__(
+        self,
+        directory,
+        ttl=60,
+        max_stale=24 * 3600,
+        max_bytes=8 << 20,
+        plugin_file=None,
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_bytes = max_bytes
+        self.plugin_file = plugin_file
+        self.metrics = metrics.for_plugin(plugin_file) if plugin_file else _NoMetrics()
+
+    def _count(self, result):
+        self.metrics.inc("homebar_cache_requests_total", {"result": result})
+
+    def fetch(self, url, data=None, headers=None, ttl=None):
+        """GET (or POST, when ``data`` is given) ``url`` through the cache."""
+        ttl = self.ttl if ttl is None else ttl
+        key = fingerprint(url, data, headers)
+        entry = self._load(key)
+
+        if entry is not None:
+            age = time.time() - entry["stored_at"]
+            if age < ttl:
+                self._touch(key)
+                self._count("fresh")
+                return self._response(entry)
+            if age < self.max_stale:
+                self._touch(key)
+                self._count("stale")
+                return self._fetch(key, url, data, headers, entry, STALE_DEADLINE)
+
+        self._count("miss")
+        return self._fetch(key, url, data, headers, entry)
+
+    def _fetch(self, key, url, data, headers, entry, deadline=None):
+        try:
+            return self.refresh(key, url, data, headers, entry, deadline=deadline)
+        except (OSError, ValueError):
+            # Network failures, timeouts and HTTP errors are all OSErrors, but
+            # a bad token should still surface, so only fall back to the last
+            # good body for server and network trouble.
+            error = sys.exc_info()[1]
+            if entry is None or 400 <= getattr(error, "code", 500) < 500:
+                raise
+            self._count("fallback")
+            if isinstance(error, client.DeadlineExceeded):
+                self._revalidate_in_background(key, url, data, headers)
+            return self._response(entry, stale=True)
+
+    def refresh(self, key, url, data=None, headers=None, entry=None, deadline=None):
+        headers = dict(headers or {})
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        with self.metrics.request(metrics.endpoint(url)) as sample:
+            response = _request(url, data=data, headers=headers, deadline=deadline)
+            sample.bytes = len(response.body)
+        if response.status == 304 and entry is not None:
+            entry["stored_at"] = time.time()
+            self._store(key, entry)
+            return self._response(entry)
+
+        if 200 <= response.status < 300:
+            self._store(
+                key,
+                {
+                    "stored_at": time.time(),
+                    "status": response.status,
+                    "etag": response.headers.get("etag"),
+                    "last_modified": response.headers.get("last-modified"),
+                    "headers": response.headers,
+                    "body": response.body.decode("utf-8"),
+                },
+            )
+        return response
+
+    def _response(self, entry, stale=False):
+        return client.Response(
+            entry["status"],
+            entry["headers"],
+            entry["body"].encode("utf-8"),
+            stale=stale,
+        )
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def _load(self, key):
+        try:
+            with open(self._path(key), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _touch(self, key):
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+
+    def _store(self, key, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+        self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits max_bytes."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+    def _revalidate_in_background(self, key, url, data, headers):
+        # One revalidation per entry at a time; the lock goes stale after
+        # REVALIDATE_TIMEOUT in case a previous child died without cleaning up
+        lock = self._path(key) + ".lock"
+        try:
+            if time.time() - os.stat(lock).st_mtime < REVALIDATE_TIMEOUT:
+                return
+            os.remove(lock)
+        except OSError:
+            pass
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except OSError:
+            return
+
+        # The request (credentials included) goes over a pipe rather than
+        # argv or disk, and the child outlives this plugin run.
+        request = {
+            "directory": self.directory,
+            "ttl": self.ttl,
+            "max_stale": self.max_stale,
+            "max_bytes": self.max_bytes,
+            "plugin_file": self.plugin_file,
+            "key": key,
+            "url": url,
+            "data": data.decode("utf-8") if data is not None else None,
+            "headers": headers or {},
+        }
+        import subprocess
+
+        try:
+            child = subprocess.Popen(
+                [sys.executable, "-m", "homebar.cache"],
+                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+            child.stdin.write(json.dumps(request).encode("utf-8"))
+            child.stdin.close()
+        except OSError:
+            os.remove(lock)
+
+
+def for_plugin(plugin_file, **kwargs):
+    return ResponseCache(
+        menus.cache_path("responses"), plugin_file=plugin_file, **kwargs
+    )
+
+
+def _revalidate(request):
+    cache = ResponseCache(
+        request["directory"],
+        ttl=request["ttl"],
+        max_stale=request["max_stale"],
+        max_bytes=request["max_bytes"],
+        plugin_file=request.get("plugin_file"),
+    )
+    key = request["key"]
+    data = request["data"]
+    try:
+        cache.refresh(
+            key,
+            request["url"],
+            data=data.encode("utf-8") if data is not None else None,
+            headers=request["headers"],
+            entry=cache._load(key),
+        )
+    finally:
+        try:
+            os.remove(cache._path(key) + ".lock")
+        except OSError:
+            pass
+        if cache.plugin_file:
+            cache.metrics.write()
+
+
+if __name__ == "__main__":
+    _revalidate(json.loads(sys.stdin.read()))
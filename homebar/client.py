@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+# Small keep-alive HTTP client shared by the plugins.
+#
+# Connections are pooled per (scheme, host, port) so every request a plugin
+# run makes to the same API reuses one TLS session.  Responses are asked for
+# gzipped and inflated as they stream in.  Connect and read deadlines keep a
+# hung socket from blocking the plugin forever, and transient failures are
+# retried a bounded number of times with exponential backoff.
+
+import json
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit
+
+from homebar import recording
+
+# Seconds allowed to open a connection, and to wait on any single read
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 20
+
+# Seconds a whole request may take, retries included
+DEADLINE = 45
+
+# Retry transient failures this many times, sleeping BACKOFF, 2 * BACKOFF, ...
+# (never more than MAX_BACKOFF) in between
+RETRIES = 2
+BACKOFF = 0.5
+MAX_BACKOFF = 4
+
+RETRY_STATUSES = (429, 502, 503, 504)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class Response(object):
+    def __init__(self, status, headers, body, stale=False):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.stale = stale
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class HTTPError(OSError):
+    def __init__(self, response):
+        super(HTTPError, self).__init__("HTTP Error %d" % response.status)
+        self.code = response.status
+        self.headers = response.headers
+        self.response = response
+
+
+class DeadlineExceeded(OSError):
+    pass
+
+
+class Client(object):
+    def __init__(
+        self,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        deadline=DEADLINE,
+        retries=RETRIES,
+    ):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self.retries = retries
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def request(self, method, url, body=None, headers=None, deadline=None):
+        """Send a request and return its Response; 4xx/5xx raise HTTPError.
+
+        ``deadline`` overrides the client's seconds for the whole request.
+        """
+        # Imported here rather than up top (it brings ssl along) so runs
+        # answered from the response cache never load it
+        import http.client
+
+        if recording.replaying():
+            response = Response(*recording.replay_http(method, url, body))
+            if response.status >= 400:
+                raise HTTPError(response)
+            return response
+
+        deadline = time.monotonic() + (self.deadline if deadline is None else deadline)
+        attempt = 0
+        while True:
+            try:
+                response = self._send(method, url, body, headers or {}, deadline)
+                if recording.recording():
+                    recording.record_http(method, url, body, response)
+            except (OSError, http.client.HTTPException) as e:
+                if isinstance(e, DeadlineExceeded) or attempt >= self.retries:
+                    if isinstance(e, OSError):
+                        raise
+                    raise OSError("%s: %s" % (type(e).__name__, e)) from e
+                delay = _backoff(attempt)
+            else:
+                if response.status not in RETRY_STATUSES or attempt >= self.retries:
+                    if response.status >= 400:
+                        raise HTTPError(response)
+                    return response
+                delay = _retry_after(response) or _backoff(attempt)
+                if delay > MAX_BACKOFF:
+                    raise HTTPError(response)
+
+            if time.monotonic() + delay >= deadline:
+                raise DeadlineExceeded("Deadline exceeded for %s" % url)
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url, headers=None):
+        return self.request("GET", url, headers=headers)
+
+    def post(self, url, body, headers=None):
+        return self.request("POST", url, body=body, headers=headers)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def _send(self, method, url, body, headers, deadline):
+        import http.client
+
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or "/"
+        if parts.query:
+            path = path + "?" + parts.query
+
+        headers = dict(headers)
+        headers.setdefault("Accept-Encoding", "gzip")
+        headers.setdefault("Connection", "keep-alive")
+
+        # A pooled connection may have been dropped by the server while it
+        # sat idle; that is not worth a retry, just reconnect once.
+        connection, reused = self._checkout(key, deadline)
+        try:
+            try:
+                sock = connection.sock
+                _settimeout(sock, min(self.read_timeout, _remaining(deadline)))
+                connection.request(method, path, body=body, headers=headers)
+                raw = connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionError):
+                if not reused:
+                    raise
+                connection.close()
+                connection, reused = self._connect(key, deadline), False
+                sock = connection.sock
+                connection.request(method, path, body=body, headers=headers)
+                raw = connection.getresponse()
+
+            # getresponse() closes the connection when the server won't keep
+            # it alive, so hold on to the socket for the read deadline
+            response = self._read(sock, raw, deadline)
+        except BaseException:
+            connection.close()
+            raise
+
+        if raw.will_close:
+            connection.close()
+        else:
+            self._checkin(key, connection)
+        return response
+
+    def _read(self, sock, raw, deadline):
+        decoder = None
+        if (raw.getheader("Content-Encoding") or "").lower() == "gzip":
+            decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+        chunks = []
+        while True:
+            _settimeout(sock, min(self.read_timeout, _remaining(deadline)))
+            chunk = raw.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            chunks.append(decoder.decompress(chunk) if decoder else chunk)
+        if decoder:
+            chunks.append(decoder.flush())
+
+        headers = {key.lower(): value for key, value in raw.getheaders()}
+        headers.pop("content-encoding", None)
+        return Response(raw.status, headers, b"".join(chunks))
+
+    def _checkout(self, key, deadline):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._connect(key, deadline), False
+
+    def _checkin(self, key, connection):
+        with self._lock:
+            self._idle.setdefault(key, []).append(connection)
+
+    def _connect(self, key, deadline):
+        import http.client
+
+        scheme, host, port = key
+        timeout = min(self.connect_timeout, _remaining(deadline))
+        if scheme == "https":
+            connection = http.client.HTTPSConnection(host, port, timeout=timeout)
+        else:
+            connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        connection.connect()
+        connection.sock.settimeout(min(self.read_timeout, _remaining(deadline)))
+        return connection
+
+
+def _remaining(deadline):
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Deadline exceeded")
+    return remaining
+
+
+def _settimeout(sock, timeout):
+    try:
+        sock.settimeout(timeout)
+    except (AttributeError, OSError):
+        # Already closed for a non keep-alive response; the read timeout set
+        # when connecting still applies
+        pass
+
+
+def _backoff(attempt):
+    return min(MAX_BACKOFF, BACKOFF * (2**attempt))
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+# One client (and so one pool) per plugin run
+default_client = Client()
+
+
+def request(method, url, body=None, headers=None, deadline=None):
+    return default_client.request(
+        method, url, body=body, headers=headers, deadline=deadline
+    )
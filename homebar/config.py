@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+# .config.yml and .credentials.env, parsed once.
+#
+# yaml and dotenv take longer to import than most plugin runs take to do
+# their work, so each file is parsed once and kept as marshal data under
+# .cache/config, keyed on the file's mtime and size.  A tick whose files
+# haven't changed imports neither.
+
+import marshal
+import os
+
+from homebar import menus
+
+
+def _cache_file(path):
+    name = os.path.basename(path).lstrip(".")
+    return menus.cache_path("config", name + ".marshal")
+
+
+def _store(cache_file, data):
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    tmp = "%s.%d.tmp" % (cache_file, os.getpid())
+    # It may hold credentials, so only we get to read it
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, cache_file)
+
+
+def cached(path, parse):
+    """``parse(path)``, from the cache while the file is unchanged.
+
+    None when the file doesn't exist.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    stamp = (st.st_mtime_ns, st.st_size)
+
+    cache_file = _cache_file(path)
+    try:
+        with open(cache_file, "rb") as f:
+            cached_stamp, value = marshal.load(f)
+        if tuple(cached_stamp) == stamp:
+            return value
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    value = parse(path)
+    try:
+        data = marshal.dumps((stamp, value))
+    except ValueError:
+        # Something marshal can't hold, like a date in the yaml
+        return value
+    _store(cache_file, data)
+    return value
+
+
+def _parse_yaml(path):
+    import yaml
+
+    with open(path, "r") as f:
+        return yaml.load(f, Loader=yaml.SafeLoader)
+
+
+def _parse_env(path):
+    from dotenv import dotenv_values
+
+    return {k: v for k, v in dotenv_values(path).items() if v is not None}
+
+
+def load_yaml(path):
+    return cached(path, _parse_yaml)
+
+
+def load_env(path):
+    """Like dotenv's load_dotenv: set what isn't in the environment yet."""
+    for key, value in (cached(path, _parse_env) or {}).items():
+        os.environ.setdefault(key, value)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+# Resident daemon that keeps every Python plugin loaded and pre-renders its
+# menu, so BitBar's per-tick process only has to print a file.
+#
+# Run it from the plugin directory with the newest interpreter the plugins
+# use, e.g. from a launchd agent:
+#
+#   cd ~/bitbar && python3.9 -m homebar.daemon
+#
+# Each ``name.<interval>.py`` plugin is imported once and its ``main()`` is
+# re-run on that interval, or when its adaptive schedule (homebar.schedule)
+# asks for, which may be sooner.  Output goes to .cache/menus via
+# menus.write, and the plugin scripts serve it from there while the daemon
+# is alive.
+
+import heapq
+import importlib.util
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from homebar import menus, schedule
+
+
+class Plugin(object):
+    def __init__(self, path):
+        self.path = path
+        self.name = menus.plugin_name(path)
+        self.interval = menus.interval(path)
+        self.module = None
+
+    def load(self):
+        module_name = "plugin_" + "".join(c if c.isalnum() else "_" for c in self.name)
+        spec = importlib.util.spec_from_file_location(module_name, self.path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        self.module = module
+
+    def render(self):
+        def _main():
+            try:
+                self.module.main()
+            except SystemExit:
+                pass
+
+        return menus.capture(_main)
+
+
+def discover(directory):
+    plugins = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not name.endswith(".py") or name.startswith("."):
+            continue
+        if not os.path.isfile(path) or menus.interval(path) is None:
+            continue
+        plugins.append(Plugin(path))
+    return plugins
+
+
+def _log(message):
+    sys.stderr.write("%s %s\n" % (time.strftime("%Y-%m-%d %H:%M:%S"), message))
+    sys.stderr.flush()
+
+
+class Daemon(object):
+    def __init__(self, plugins):
+        self.plugins = plugins
+        self.queue = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = False
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(plugins)))
+
+    def start(self):
+        for plugin in self.plugins:
+            try:
+                plugin.load()
+            except Exception:
+                _log("could not load %s\n%s" % (plugin.name, traceback.format_exc()))
+                continue
+            if not hasattr(plugin.module, "main"):
+                _log("%s has no main(), skipping" % plugin.name)
+                continue
+            self.schedule(plugin, time.time())
+
+    def schedule(self, plugin, due):
+        with self.lock:
+            heapq.heappush(self.queue, (due, plugin.name, plugin))
+        self.wakeup.set()
+
+    def run(self):
+        while not self.stopped:
+            with self.lock:
+                due = self.queue[0][0] if self.queue else None
+            timeout = None if due is None else max(0, due - time.time())
+            if timeout is None or timeout > 0:
+                self.wakeup.wait(timeout)
+                self.wakeup.clear()
+                continue
+
+            # A plugin is only queued again once its run has finished, so
+            # runs of the same plugin never overlap
+            with self.lock:
+                _, _, plugin = heapq.heappop(self.queue)
+            self.executor.submit(self.refresh, plugin)
+
+    def refresh(self, plugin):
+        started = time.time()
+        try:
+            menus.write(plugin.path, plugin.render())
+        except Exception:
+            _log("%s failed\n%s" % (plugin.name, traceback.format_exc()))
+        finally:
+            # Plugins with an adaptive schedule say when they want to run.
+            # Those backing off are still run every interval: main() then
+            # just reprints the last menu, and writing it again keeps it
+            # young enough for menus.serve_resident to serve.
+            due = schedule.next_due(plugin.path) or started + plugin.interval
+            due = min(due, started + plugin.interval)
+            self.schedule(plugin, max(due, time.time() + 1))
+
+    def stop(self, *args):
+        self.stopped = True
+        self.wakeup.set()
+
+
+def _write_pid():
+    path = menus.cache_path("daemon.pid")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(str(os.getpid()))
+    return path
+
+
+def main():
+    daemon = Daemon(discover(menus.plugin_directory()))
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+
+    pid_path = _write_pid()
+    try:
+        daemon.start()
+        daemon.run()
+    finally:
+        try:
+            os.remove(pid_path)
+        except OSError:
+            pass
+        daemon.executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+# Local copy of the Jira issues a plugin shows, keyed by issue key.
+#
+# A refresh only asks Jira for what was updated since the last sync and
+# merges it in.  Issues that stop matching (reassigned, moved, deleted) don't
+# show up in that query, so every now and then a key-only query of everything
+# that matches is used to drop the rest.
+
+import json
+import os
+
+
+class IssueStore(object):
+    def __init__(self, path):
+        self.path = path
+        state = self._load()
+        self.issues = state.get("issues", {})
+        self.synced_at = state.get("synced_at")
+        self.reconciled_at = state.get("reconciled_at")
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def put(self, issue):
+        self.issues[issue["key"]] = issue
+
+    def retain(self, keys):
+        """Forget every issue not in ``keys``."""
+        for key in set(self.issues) - set(keys):
+            del self.issues[key]
+
+    def values(self):
+        return list(self.issues.values())
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(
+                {
+                    "issues": self.issues,
+                    "synced_at": self.synced_at,
+                    "reconciled_at": self.reconciled_at,
+                },
+                f,
+            )
+        os.replace(tmp, self.path)
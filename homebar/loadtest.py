@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+# Load test of the plugins against the stand-ins in homebar.mockapi.
+#
+#   python3 -m homebar.loadtest --duration 60 --tick 2 --size 2000
+#   python3 -m homebar.loadtest --plugins github --gh-p99-ms 8000 --burst 3
+#
+# Copies the plugins and homebar into a scratch plugin directory (its own
+# .config.yml and .cache), starts the stand-in servers and a fake gh, and
+# then starts every plugin each ``--tick`` seconds the way BitBar does: as a
+# new process, whether or not the last one has finished.  ``--burst`` starts
+# that many copies at once, like "Refresh all".  The plugins' schedules and
+# response cache are cleared before every tick so every run goes to the API;
+# pass ``--keep-cache`` to let them skip ticks and reuse responses as they
+# would in BitBar.
+#
+# Reports p50/p99/max refresh time per plugin, how many of its processes
+# were alive at once (the pile-up), failed and unfinished runs, and what the
+# stand-ins answered.
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from homebar import bench, menus, mockapi
+
+# Seconds the last runs get to finish once the test is over
+GRACE = 30
+
+
+class Run(object):
+    def __init__(self, plugin, process, started, alive):
+        self.plugin = plugin
+        self.process = process
+        self.started = started
+        # This plugin's processes alive as this one started, itself included
+        self.alive = alive
+        self.seconds = None
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = max(0, int(round(fraction * len(ordered) + 0.5)) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def prepare(directory, plugins, repos):
+    """A plugin directory with copies of ``plugins`` and homebar."""
+    source = menus.plugin_directory()
+    for plugin in plugins:
+        shutil.copy2(os.path.join(source, plugin), directory)
+    shutil.copytree(
+        os.path.join(source, "homebar"),
+        os.path.join(directory, "homebar"),
+        ignore=shutil.ignore_patterns("__pycache__"),
+    )
+    with open(os.path.join(directory, ".config.yml"), "w") as f:
+        f.write("active_repos:\n")
+        for i in range(repos):
+            f.write("  - org/repo-%d\n" % i)
+
+
+class Driver(object):
+    def __init__(self, directory, plugins, environment, tick, burst, keep_cache):
+        self.directory = directory
+        self.plugins = plugins
+        self.environment = environment
+        self.tick = tick
+        self.burst = burst
+        self.keep_cache = keep_cache
+        self.runs = []
+        self.lock = threading.Lock()
+
+    def _alive(self, plugin):
+        return sum(
+            1 for run in self.runs if run.plugin == plugin and run.seconds is None
+        )
+
+    def _start(self, plugin):
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(self.directory, plugin)],
+            cwd=self.directory,
+            env=self.environment,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        with self.lock:
+            run = Run(plugin, process, started, self._alive(plugin) + 1)
+            self.runs.append(run)
+        threading.Thread(target=self._wait, args=(run,), daemon=True).start()
+
+    def _wait(self, run):
+        run.process.wait()
+        with self.lock:
+            run.seconds = time.perf_counter() - run.started
+
+    def _clear_cache(self):
+        cache_dir = self.environment["HOMEBAR_CACHE_DIR"]
+        for plugin in self.plugins:
+            try:
+                os.remove(os.path.join(cache_dir, "schedule", plugin + ".json"))
+            except OSError:
+                pass
+        shutil.rmtree(os.path.join(cache_dir, "responses"), ignore_errors=True)
+
+    def run(self, duration):
+        ends_at = time.perf_counter() + duration
+        next_tick = time.perf_counter()
+        while next_tick < ends_at:
+            if not self.keep_cache:
+                self._clear_cache()
+            for plugin in self.plugins:
+                for _ in range(self.burst):
+                    self._start(plugin)
+            next_tick += self.tick
+            time.sleep(max(0, next_tick - time.perf_counter()))
+
+        deadline = time.perf_counter() + GRACE
+        for run in list(self.runs):
+            try:
+                run.process.wait(max(0, deadline - time.perf_counter()))
+            except subprocess.TimeoutExpired:
+                run.process.kill()
+        time.sleep(0.1)
+
+    def report(self):
+        print(
+            "%-28s %5s %9s %9s %9s %7s %7s %6s %6s"
+            % (
+                "plugin",
+                "runs",
+                "p50",
+                "p99",
+                "max",
+                "pileup",
+                "mean",
+                "failed",
+                "hung",
+            )
+        )
+        for plugin in self.plugins:
+            runs = [run for run in self.runs if run.plugin == plugin]
+            finished = [run for run in runs if run.process.returncode is not None]
+            times = [run.seconds for run in finished if run.seconds is not None]
+            failed = sum(1 for run in finished if run.process.returncode != 0)
+            hung = sum(1 for run in runs if run.process.returncode in (None, -9))
+            alive = [run.alive for run in runs] or [0]
+            print(
+                "%-28s %5d %7.0fms %7.0fms %7.0fms %7d %7.1f %6d %6d"
+                % (
+                    plugin,
+                    len(runs),
+                    (percentile(times, 0.50) or 0) * 1000,
+                    (percentile(times, 0.99) or 0) * 1000,
+                    max(times or [0]) * 1000,
+                    max(alive),
+                    sum(alive) / float(len(alive)),
+                    failed,
+                    hung,
+                )
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m homebar.loadtest")
+    parser.add_argument(
+        "--plugins",
+        default=",".join(bench.PLUGINS),
+        help="comma separated, of %s (default: all)" % ", ".join(bench.PLUGINS),
+    )
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--tick", type=float, default=5, help="seconds between starts")
+    parser.add_argument("--burst", type=int, default=1, help="copies started a tick")
+    parser.add_argument("--keep-cache", action="store_true")
+    parser.add_argument("--size", type=int, default=500, help="items per API")
+    parser.add_argument("--repos", type=int, default=10, help="active repos for gh")
+    mockapi.faults_arguments(parser, latency_ms=150, p99_ms=1500)
+    mockapi.faults_arguments(parser, "gh-", latency_ms=800, p99_ms=3000)
+    parser.add_argument("--rate-limit", type=int, default=5000)
+    parser.add_argument("--rate-window", type=float, default=3600)
+    args = parser.parse_args(argv)
+
+    plugins = [bench.PLUGINS[name] for name in args.plugins.split(",")]
+    directory = tempfile.mkdtemp(prefix="homebar-load-")
+    try:
+        prepare(directory, plugins, args.repos)
+        server = mockapi.Server(
+            mockapi.Datasets(args.size),
+            {api: mockapi.faults_from(args) for api in ("github", "circleci", "jira")},
+        ).start()
+        environment = dict(os.environ)
+        for key in ("HOMEBAR_RECORD", "HOMEBAR_REPLAY"):
+            environment.pop(key, None)
+        environment.update(bench.ENVIRONMENT)
+        environment.update(server.environment())
+        environment.update(
+            HOMEBAR_CACHE_DIR=os.path.join(directory, ".cache"),
+            GH_BIN=mockapi.write_gh(
+                os.path.join(directory, "gh"),
+                mockapi.faults_from(args, "gh-"),
+                args.size,
+            ),
+        )
+
+        driver = Driver(
+            directory,
+            plugins,
+            environment,
+            args.tick,
+            args.burst,
+            args.keep_cache,
+        )
+        driver.run(args.duration)
+        driver.report()
+        print()
+        for (api, outcome), count in server.stats.rows():
+            print("%-28s %5s %9d" % (api, outcome, count))
+        server.shutdown()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+# Memoized rendering, and the time tokens that make it safe.
+#
+# A plugin hands Memo.render the data its menu is drawn from.  When that
+# hashes the same as last time, the text drawn then is printed as is and
+# the drawing code doesn't run at all.
+#
+# Text that depends on the clock ("5 minutes ago") would go stale that way,
+# so it is drawn as a token instead, e.g. ``{{ago:2021-03-01T10:00:00Z}}``,
+# and only expanded when the menu goes out to BitBar (menus.show).  Menu
+# files, memos and the daemon's renderings all keep the tokens.
+
+import datetime
+import json
+import os
+import re
+import sys
+import time
+
+from homebar import menus, schedule
+
+TOKEN = re.compile(r"\{\{(\w+):([^}]*)\}\}")
+
+
+def token(name, value):
+    return "{{%s:%s}}" % (name, value)
+
+
+def pretty_date(time_str=False):
+    if not time_str:
+        return ""
+
+    time = datetime.datetime.fromisoformat(time_str[:-1])
+    now = datetime.datetime.now()
+    diff = now - time
+    second_diff = diff.seconds
+    day_diff = diff.days
+
+    if day_diff < 0:
+        return ""
+
+    if day_diff == 0:
+        if second_diff < 10:
+            return "just now"
+        if second_diff < 60:
+            return f"{second_diff} seconds ago"
+        if second_diff < 120:
+            return "a minute ago"
+        if second_diff < 3600:
+            return str(second_diff / 60) + " minutes ago"
+        if second_diff < 7200:
+            return "an hour ago"
+        if second_diff < 86400:
+            return f"{second_diff / 3600:0.0f} hours ago"
+    if day_diff == 1:
+        return "yesterday"
+    if day_diff < 7:
+        return str(day_diff) + " days ago"
+    if day_diff < 31:
+        return str(day_diff / 7) + " weeks ago"
+    if day_diff < 365:
+        return str(day_diff / 30) + " months ago"
+    return str(day_diff / 365) + " years ago"
+
+
+def minutes_left(timestamp):
+    """Whole minutes until a unix ``timestamp``, as "7m"."""
+    return "%dm" % round(max(0, float(timestamp) - time.time()) / 60.0)
+
+
+FORMATTERS = {
+    "ago": pretty_date,
+    "left": minutes_left,
+}
+
+
+def expand(text):
+    return TOKEN.sub(lambda m: FORMATTERS[m.group(1)](m.group(2)), text)
+
+
+class Memo(object):
+    def __init__(self, plugin_file):
+        self.plugin_file = plugin_file
+        self.path = menus.cache_path("memo", menus.plugin_name(plugin_file) + ".json")
+
+    def _key(self, data):
+        # An edited plugin or a switch to dark mode draws differently
+        return schedule.fingerprint(
+            [
+                data,
+                os.stat(self.plugin_file).st_mtime,
+                os.environ.get("BitBarDarkMode"),
+            ]
+        )
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, key, text):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "text": text}, f)
+        os.replace(tmp, self.path)
+
+    def render(self, data, fn, *args):
+        """Print what ``fn(*args)`` prints, from the memo if ``data`` is unchanged."""
+        key = self._key(data)
+        memo = self._load()
+        if memo.get("key") == key:
+            text = memo["text"]
+        else:
+            text = menus.capture(fn, *args)
+            self._save(key, text)
+        sys.stdout.write(text)
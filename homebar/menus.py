@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+# Rendered BitBar menus, kept on disk next to the plugins.
+#
+# The resident daemon (``python3 -m homebar.daemon``) renders every plugin on
+# its own schedule and writes the text here.  Each plugin script checks for
+# that text before doing any real work, so a BitBar tick costs one small
+# import and a file read while the daemon is up.  This module is imported
+# first by every plugin, so it must stay cheap: standard library only.
+
+import io
+import os
+import re
+import sys
+import threading
+import time
+
+INTERVAL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# A menu older than this many refresh intervals (plus SLACK seconds) is not
+# served; the plugin renders itself instead
+STALE_INTERVALS = 2
+SLACK = 10
+
+
+def plugin_directory():
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def cache_path(*parts):
+    """Where plugin state lives; HOMEBAR_CACHE_DIR moves it (for benchmarks)."""
+    root = os.environ.get("HOMEBAR_CACHE_DIR") or os.path.join(
+        plugin_directory(), ".cache"
+    )
+    return os.path.join(root, *parts)
+
+
+def plugin_name(plugin_file):
+    return os.path.basename(plugin_file)
+
+
+def interval(plugin_file):
+    """Refresh interval in seconds, from BitBar's ``name.5m.py`` naming."""
+    parts = plugin_name(plugin_file).split(".")
+    if len(parts) >= 3:
+        result = re.match(r"^(\d+)([smhd])$", parts[-2])
+        if result:
+            return int(result.group(1)) * INTERVAL_UNITS[result.group(2)]
+    return None
+
+
+def menu_path(plugin_file):
+    return cache_path("menus", plugin_name(plugin_file) + ".txt")
+
+
+def write(plugin_file, text):
+    path = menu_path(plugin_file)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def emit(plugin_file, fn):
+    """Run ``fn``, keep what it printed as the plugin's menu, and print it."""
+    text = capture(fn)
+    write(plugin_file, text)
+    show(text)
+
+
+def show(text):
+    """Print a menu, expanding its time tokens (see homebar.memo) unless
+    it's being captured to be kept."""
+    if "{{" in text and not _capturing():
+        from homebar import memo
+
+        text = memo.expand(text)
+    sys.stdout.write(text)
+
+
+def read(plugin_file, max_age=None):
+    path = menu_path(plugin_file)
+    try:
+        if max_age is not None and time.time() - os.stat(path).st_mtime > max_age:
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def daemon_running():
+    try:
+        with open(cache_path("daemon.pid"), "r") as f:
+            pid = int(f.read().strip())
+        os.kill(pid, 0)
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+def serve_resident(plugin_file):
+    """Print the daemon's rendering of this plugin, if it has a fresh one."""
+    seconds = interval(plugin_file)
+    if seconds is None or not daemon_running():
+        return False
+    text = read(plugin_file, max_age=STALE_INTERVALS * seconds + SLACK)
+    if text is None:
+        return False
+    show(text)
+    sys.stdout.flush()
+    return True
+
+
+class _ThreadStdout(object):
+    """Stands in for sys.stdout so each thread can capture its own prints."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def _target(self):
+        buffers = getattr(self.local, "buffers", None)
+        return buffers[-1] if buffers else self.stream
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        return self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def _capturing():
+    stdout = sys.stdout
+    return isinstance(stdout, _ThreadStdout) and bool(
+        getattr(stdout.local, "buffers", None)
+    )
+
+
+def capture(fn, *args, **kwargs):
+    """Run ``fn`` and return what it printed instead of printing it.
+
+    Unlike contextlib.redirect_stdout this only captures the calling thread,
+    so several plugins can render side by side in the daemon.
+    """
+    if not isinstance(sys.stdout, _ThreadStdout):
+        sys.stdout = _ThreadStdout(sys.stdout)
+    local = sys.stdout.local
+    if not hasattr(local, "buffers"):
+        local.buffers = []
+
+    buffer = io.StringIO()
+    local.buffers.append(buffer)
+    try:
+        fn(*args, **kwargs)
+    finally:
+        local.buffers.pop()
+    return buffer.getvalue()
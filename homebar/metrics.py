@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+# Prometheus metrics, for node_exporter's textfile collector.
+#
+#   node_exporter --collector.textfile.directory ~/bitbar/.cache/metrics
+#
+# Each plugin counts what its runs cost: how long each endpoint takes and how
+# much it sends back, how often the response cache answers, how many ``gh``
+# processes it starts, its API quota, and what went wrong.  Counters and
+# histograms add up across runs (every BitBar tick is a new process), so the
+# totals are kept next to the output and each run adds to them.  After every
+# run the plugin's ``<plugin>.prom`` is rewritten whole, by rename, so the
+# collector never reads half a file.  HOMEBAR_METRICS_DIR moves the .prom
+# files to wherever node_exporter looks.
+
+import contextlib
+import fcntl
+import json
+import os
+import threading
+import time
+
+from homebar import menus
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    "homebar_runs_total": ("counter", "Plugin runs that were due and finished.", None),
+    "homebar_run_errors_total": (
+        "counter",
+        "Plugin runs that failed, by exception type.",
+        None,
+    ),
+    "homebar_request_duration_seconds": (
+        "histogram",
+        "Time taken by each API request or command, by endpoint.",
+        (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    ),
+    "homebar_response_bytes": (
+        "histogram",
+        "Size of each response body, by endpoint.",
+        (1 << 10, 4 << 10, 16 << 10, 64 << 10, 256 << 10, 1 << 20, 4 << 20),
+    ),
+    "homebar_request_errors_total": (
+        "counter",
+        "Failed requests, by endpoint and HTTP status or error type.",
+        None,
+    ),
+    "homebar_cache_requests_total": (
+        "counter",
+        "Response cache lookups: fresh hits, stale entries revalidated, "
+        "misses, and stale bodies served when the API failed or was slow.",
+        None,
+    ),
+    "homebar_gh_spawns_total": ("counter", "gh processes started.", None),
+    "homebar_quota_remaining": ("gauge", "API requests or points left.", None),
+    "homebar_quota_limit": ("gauge", "API requests or points per window.", None),
+    "homebar_graphql_cost": ("gauge", "Points the last GraphQL query cost.", None),
+}
+
+_TABLES = {"counter": "counters", "gauge": "gauges", "histogram": "histograms"}
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def metrics_dir():
+    return os.environ.get("HOMEBAR_METRICS_DIR") or menus.cache_path("metrics")
+
+
+def endpoint(url):
+    """What a URL is labelled with: its host and path, without the query."""
+    from urllib.parse import urlsplit
+
+    parts = urlsplit(url)
+    return parts.netloc + parts.path
+
+
+def _key(labels):
+    return json.dumps(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs, extra=()):
+    pairs = list(pairs) + list(extra)
+    if not pairs:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (k, _escape(v)) for k, v in pairs)
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Sample(object):
+    """What a timed request fills in as it goes."""
+
+    def __init__(self):
+        self.bytes = None
+        self.error = None
+
+
+class Registry(object):
+    def __init__(self, plugin_file):
+        self.plugin = menus.plugin_name(plugin_file)
+        self.lock = threading.Lock()
+        # Not yet added to the totals on disk
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def _series(self, table, name, labels):
+        labels = dict(labels or {}, plugin=self.plugin)
+        return table.setdefault(name, {}), _key(labels)
+
+    def inc(self, name, labels=None, value=1):
+        with self.lock:
+            series, key = self._series(self.counters, name, labels)
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name, value, labels=None):
+        with self.lock:
+            series, key = self._series(self.gauges, name, labels)
+            series[key] = value
+
+    def observe(self, name, value, labels=None):
+        buckets = METRICS[name][2]
+        with self.lock:
+            series, key = self._series(self.histograms, name, labels)
+            histogram = series.setdefault(
+                key, {"buckets": [0] * len(buckets), "sum": 0, "count": 0}
+            )
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    @contextlib.contextmanager
+    def request(self, name):
+        """Time what runs inside as a request to endpoint ``name``.
+
+        Set ``bytes`` on what it yields to record the response size; an
+        exception is counted as an error, by its HTTP status when it has one.
+        """
+        labels = {"endpoint": name}
+        sample = Sample()
+        started = time.perf_counter()
+        try:
+            yield sample
+        except BaseException as e:
+            sample.error = getattr(e, "code", None) or type(e).__name__
+            raise
+        finally:
+            self.observe(
+                "homebar_request_duration_seconds",
+                time.perf_counter() - started,
+                labels,
+            )
+            if sample.bytes is not None:
+                self.observe("homebar_response_bytes", sample.bytes, labels)
+            if sample.error is not None:
+                self.inc(
+                    "homebar_request_errors_total",
+                    dict(labels, code=str(sample.error)),
+                )
+
+    def _take(self):
+        with self.lock:
+            taken = (self.counters, self.gauges, self.histograms)
+            self.counters, self.gauges, self.histograms = {}, {}, {}
+        return taken
+
+    def write(self):
+        """Add this run's numbers to the totals and rewrite the .prom file."""
+        counters, gauges, histograms = self._take()
+        state_path = menus.cache_path("metrics", self.plugin + ".json")
+        os.makedirs(os.path.dirname(state_path), exist_ok=True)
+        # Overlapping runs (BitBar and the daemon) each add to the totals
+        with open(state_path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                state = _load(state_path)
+                _merge(state, counters, gauges, histograms)
+                _store(state_path, json.dumps(state))
+                prom_path = os.path.join(metrics_dir(), self.plugin + ".prom")
+                os.makedirs(os.path.dirname(prom_path), exist_ok=True)
+                _store(prom_path, _format(state))
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def for_plugin(plugin_file):
+    """The plugin's Registry; one per plugin, shared by every module."""
+    name = menus.plugin_name(plugin_file)
+    with _registries_lock:
+        if name not in _registries:
+            _registries[name] = Registry(plugin_file)
+        return _registries[name]
+
+
+def _load(path):
+    try:
+        with open(path, "r") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    for table in _TABLES.values():
+        state.setdefault(table, {})
+    return state
+
+
+def _store(path, text):
+    tmp = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _merge(state, counters, gauges, histograms):
+    for name, series in counters.items():
+        totals = state["counters"].setdefault(name, {})
+        for key, value in series.items():
+            totals[key] = totals.get(key, 0) + value
+    for name, series in gauges.items():
+        state["gauges"].setdefault(name, {}).update(series)
+    for name, series in histograms.items():
+        totals = state["histograms"].setdefault(name, {})
+        for key, histogram in series.items():
+            total = totals.get(key)
+            if total is None or len(total["buckets"]) != len(histogram["buckets"]):
+                totals[key] = histogram
+                continue
+            total["buckets"] = [
+                a + b for a, b in zip(total["buckets"], histogram["buckets"])
+            ]
+            total["sum"] += histogram["sum"]
+            total["count"] += histogram["count"]
+
+
+def _format(state):
+    lines = []
+    for name, (kind, help_text, buckets) in sorted(METRICS.items()):
+        series = state[_TABLES[kind]].get(name)
+        if not series:
+            continue
+        lines.append("# HELP %s %s" % (name, help_text))
+        lines.append("# TYPE %s %s" % (name, kind))
+        for key, value in sorted(series.items()):
+            labels = [tuple(pair) for pair in json.loads(key)]
+            if kind != "histogram":
+                lines.append("%s%s %s" % (name, _labels(labels), _number(value)))
+                continue
+            for bound, count in zip(buckets, value["buckets"]):
+                lines.append(
+                    "%s_bucket%s %d"
+                    % (name, _labels(labels, [("le", _number(bound))]), count)
+                )
+            lines.append(
+                "%s_bucket%s %d"
+                % (name, _labels(labels, [("le", "+Inf")]), value["count"])
+            )
+            lines.append("%s_sum%s %s" % (name, _labels(labels), _number(value["sum"])))
+            lines.append("%s_count%s %d" % (name, _labels(labels), value["count"]))
+    return "\n".join(lines) + "\n"
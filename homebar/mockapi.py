@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+
+# Local stand-ins for GitHub, CircleCI, Jira and gh, for load tests.
+#
+#   python3 -m homebar.mockapi --size 2000 --latency-ms 150 --error-rate 0.02 \
+#       --gh /tmp/gh
+#   python3 -m homebar.mockapi gh pr list -R org/repo --json number,title
+#
+# One HTTP server answers the endpoints the plugins call: GitHub's GraphQL
+# ``search`` and ``nodes``, CircleCI's v1.1 ``recent-builds`` and project
+# builds, and Jira's ``/rest/api/3/search``, with datasets from homebar.bench.
+# Every response is held up by a latency drawn from a log-normal with the
+# given median and p99, a share of them fail with a 502, and each API keeps
+# a request quota it reports in X-RateLimit-* headers (and GraphQL's
+# ``rateLimit``) and enforces with 429s.  The ``gh`` subcommand stands in for
+# the gh executable the same way, configured through HOMEBAR_MOCK_GH.
+#
+# Point the plugins at it with the environment the server prints
+# (GITHUB_GRAPHQL_URL, CIRCLECI_API_URL, JIRA_BASE_URL, GH_BIN); see
+# homebar.loadtest for driving them.
+
+import argparse
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from homebar import bench
+
+# Environment variable carrying the fake gh's Faults, as JSON
+GH_ENVIRONMENT = "HOMEBAR_MOCK_GH"
+
+# z-score of the 99th percentile of a normal distribution
+Z99 = 2.326
+
+SEARCH = re.compile(
+    r'(\w+): search\(query: ("(?:[^"\\]|\\.)*"), type: ISSUE, first: (\d+)'
+    r'(?:, after: ("(?:[^"\\]|\\.)*"))?\)'
+)
+NODES = re.compile(r"nodes\(ids: (\[[^\]]*\])\)")
+
+
+class Faults(object):
+    """Latency, failures and quota of one stand-in."""
+
+    def __init__(
+        self,
+        latency_ms=100,
+        p99_ms=1000,
+        error_rate=0.0,
+        rate_limit=5000,
+        rate_window=3600,
+        seed=None,
+    ):
+        self.latency_ms = latency_ms
+        self.p99_ms = max(p99_ms, latency_ms)
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window_start = time.time()
+        self.used = 0
+
+    def latency(self):
+        """Seconds to hold a response up for."""
+        if self.latency_ms <= 0:
+            return 0.0
+        sigma = math.log(self.p99_ms / float(self.latency_ms)) / Z99
+        with self.lock:
+            return self.rng.lognormvariate(math.log(self.latency_ms), sigma) / 1000.0
+
+    def fails(self):
+        with self.lock:
+            return self.rng.random() < self.error_rate
+
+    def take(self):
+        """Spend one request of the quota: (remaining, reset_at), remaining
+        going negative once it's used up."""
+        with self.lock:
+            now = time.time()
+            if now - self.window_start >= self.rate_window:
+                self.window_start, self.used = now, 0
+            self.used += 1
+            return self.rate_limit - self.used, self.window_start + self.rate_window
+
+    def to_json(self):
+        return json.dumps(
+            {
+                "latency_ms": self.latency_ms,
+                "p99_ms": self.p99_ms,
+                "error_rate": self.error_rate,
+                "rate_limit": self.rate_limit,
+                "rate_window": self.rate_window,
+            }
+        )
+
+
+class Datasets(object):
+    """What the stand-ins serve, built once per size."""
+
+    def __init__(self, size, seed=0):
+        self.size = size
+        self.github = bench.github_nodes(size, seed)
+        self.github_by_id = {node["id"]: node for node in self.github}
+        self.circleci = bench.circleci_builds(size, seed)
+        self.jira = bench.jira_issues(size, seed)
+        # Jira key -> when update_issue last changed it
+        self.jira_updated = {}
+
+    def update_issue(self, issue):
+        """Add or change a Jira issue, as of now."""
+        self.remove_issue(issue["key"])
+        self.jira.append(issue)
+        self.jira_updated[issue["key"]] = time.time()
+
+    def remove_issue(self, key):
+        """Take a Jira issue out of every query, as when it's reassigned."""
+        self.jira = [issue for issue in self.jira if issue["key"] != key]
+        self.jira_updated.pop(key, None)
+
+
+class Stats(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def add(self, api, outcome):
+        with self.lock:
+            key = (api, outcome)
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def rows(self):
+        with self.lock:
+            return sorted(self.counts.items())
+
+
+def _page(items, offset, limit):
+    return items[offset : offset + limit]
+
+
+def graphql(datasets, document, faults, remaining, reset_at):
+    """A response to the plugin's GraphQL documents: aliased searches,
+    ``nodes`` lookups and ``rateLimit``."""
+    data = {}
+    for alias, query, first, after in SEARCH.findall(document):
+        query = json.loads(query)
+        # No hotfix PRs, so the freeze searches find nothing
+        nodes = [] if "base:hotfix" in query else datasets.github
+        offset = int(json.loads(after)) if after else 0
+        page = _page(nodes, offset, int(first))
+        end = offset + len(page)
+        data[alias] = {
+            "issueCount": len(nodes),
+            "pageInfo": {"hasNextPage": end < len(nodes), "endCursor": str(end)},
+            "edges": [{"node": node} for node in page],
+        }
+    match = NODES.search(document)
+    if match:
+        ids = json.loads(match.group(1))
+        data["nodes"] = [datasets.github_by_id.get(i) for i in ids]
+    if "rateLimit" in document:
+        data["rateLimit"] = {
+            "cost": 1,
+            "remaining": max(0, remaining),
+            "limit": faults.rate_limit,
+            "resetAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(reset_at)),
+        }
+    return {"data": data}
+
+
+def circleci(datasets, path, query):
+    builds = datasets.circleci
+    match = re.match(r"^/api/v1\.1/project/[^/]+/[^/]+/([^/]+)$", path)
+    if match:
+        builds = [b for b in builds if b["reponame"] == match.group(1)]
+    offset = int(query.get("offset", ["0"])[0])
+    limit = int(query.get("limit", ["30"])[0])
+    return _page(builds, offset, limit)
+
+
+def _updated_since(datasets, index, issue, since):
+    at = datasets.jira_updated.get(issue["key"])
+    if at is None:
+        # Of the issues nobody changed, every 50th stands for the few that
+        # change all the time
+        return index % 50 == 0
+    return at >= since
+
+
+def jira(datasets, query):
+    jql = query.get("jql", [""])[0]
+    issues = datasets.jira
+    match = re.search(r'updated >= "-(\d+)m"', jql)
+    if match:
+        since = time.time() - int(match.group(1)) * 60
+        issues = [
+            issue
+            for i, issue in enumerate(issues)
+            if _updated_since(datasets, i, issue, since)
+        ]
+    if query.get("fields", [""])[0] == "key":
+        issues = [{"key": issue["key"]} for issue in issues]
+    start_at = int(query.get("startAt", ["0"])[0])
+    max_results = min(100, int(query.get("maxResults", ["50"])[0]))
+    return {
+        "startAt": start_at,
+        "maxResults": max_results,
+        "total": len(issues),
+        "issues": _page(issues, start_at, max_results),
+    }
+
+
+def _api(path):
+    if path == "/graphql":
+        return "github"
+    if path.startswith("/api/v1.1/"):
+        return "circleci"
+    if path.startswith("/rest/api/"):
+        return "jira"
+    return None
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, body=None):
+        server = self.server
+        parts = urlsplit(self.path)
+        api = _api(parts.path)
+        if api is None:
+            self._send(404, {"message": "Not Found"})
+            return
+
+        faults = server.faults[api]
+        time.sleep(faults.latency())
+        remaining, reset_at = faults.take()
+        headers = {
+            "X-RateLimit-Limit": str(faults.rate_limit),
+            "X-RateLimit-Remaining": str(max(0, remaining)),
+            "X-RateLimit-Reset": str(int(reset_at)),
+        }
+        if remaining < 0:
+            server.stats.add(api, "429")
+            headers["Retry-After"] = str(max(1, int(reset_at - time.time())))
+            self._send(429, {"message": "rate limited"}, headers)
+            return
+        if faults.fails():
+            server.stats.add(api, "502")
+            self._send(502, {"message": "Bad Gateway"}, headers)
+            return
+
+        datasets = server.datasets
+        if api == "github":
+            document = json.loads(body or b"{}").get("query", "")
+            payload = graphql(datasets, document, faults, remaining, reset_at)
+        elif api == "circleci":
+            payload = circleci(datasets, parts.path, parse_qs(parts.query))
+        else:
+            payload = jira(datasets, parse_qs(parts.query))
+        server.stats.add(api, "200")
+        self._send(200, payload, headers)
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self._handle(self.rfile.read(length))
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, datasets, faults, port=0):
+        """``faults`` maps "github", "circleci" and "jira" to their Faults."""
+        ThreadingHTTPServer.__init__(self, ("127.0.0.1", port), Handler)
+        self.datasets = datasets
+        self.faults = faults
+        self.stats = Stats()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self.server_address[1]
+
+    def environment(self):
+        """Where the plugins find the stand-ins."""
+        return {
+            "GITHUB_GRAPHQL_URL": self.url + "/graphql",
+            "CIRCLECI_API_URL": self.url + "/api/v1.1",
+            "JIRA_BASE_URL": self.url,
+        }
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+
+def write_gh(path, faults, size):
+    """Write an executable at ``path`` that stands in for gh."""
+    with open(path, "w") as f:
+        f.write(
+            "#!/bin/sh\n"
+            "export PYTHONPATH='%s'\n"
+            "export %s='%s'\n"
+            "exec '%s' -m homebar.mockapi gh --size %d \"$@\"\n"
+            % (
+                os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                GH_ENVIRONMENT,
+                faults.to_json(),
+                sys.executable,
+                size,
+            )
+        )
+    os.chmod(path, 0o755)
+    return path
+
+
+def gh(argv):
+    """``gh pr list -L n -R repo --search q --json fields``, from the dataset."""
+    parser = argparse.ArgumentParser(prog="gh")
+    parser.add_argument("--size", type=int, default=100)
+    parser.add_argument("command", nargs="*")
+    parser.add_argument("-L", "--limit", type=int, default=30)
+    parser.add_argument("-R", "--repo")
+    parser.add_argument("--search")
+    parser.add_argument("--json", default="number")
+    args = parser.parse_args(argv)
+
+    faults = Faults(**json.loads(os.environ.get(GH_ENVIRONMENT) or "{}"))
+    time.sleep(faults.latency())
+    if faults.fails():
+        sys.stderr.write("HTTP 502: Bad Gateway (https://api.github.com/graphql)\n")
+        return 1
+
+    fields = args.json.split(",")
+    seed = zlib.crc32((args.repo or "").encode("utf-8"))
+    items = bench.gh_items(args.size, seed=seed)[: args.limit]
+    json.dump([{k: item.get(k) for k in fields} for item in items], sys.stdout)
+    return 0
+
+
+def faults_arguments(parser, prefix="", latency_ms=100, p99_ms=1000):
+    parser.add_argument("--%slatency-ms" % prefix, type=float, default=latency_ms)
+    parser.add_argument("--%sp99-ms" % prefix, type=float, default=p99_ms)
+    parser.add_argument("--%serror-rate" % prefix, type=float, default=0.0)
+
+
+def faults_from(args, prefix=""):
+    prefix = prefix.replace("-", "_")
+    return Faults(
+        latency_ms=getattr(args, prefix + "latency_ms"),
+        p99_ms=getattr(args, prefix + "p99_ms"),
+        error_rate=getattr(args, prefix + "error_rate"),
+        rate_limit=args.rate_limit,
+        rate_window=args.rate_window,
+    )
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["gh"]:
+        sys.exit(gh(argv[1:]))
+
+    parser = argparse.ArgumentParser(prog="python3 -m homebar.mockapi")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--size", type=int, default=500, help="items per API")
+    faults_arguments(parser)
+    parser.add_argument("--rate-limit", type=int, default=5000)
+    parser.add_argument("--rate-window", type=float, default=3600)
+    parser.add_argument("--gh", help="write a fake gh here, for GH_BIN")
+    args = parser.parse_args(argv)
+
+    server = Server(
+        Datasets(args.size),
+        {api: faults_from(args) for api in ("github", "circleci", "jira")},
+        port=args.port,
+    )
+    environment = server.environment()
+    if args.gh:
+        environment["GH_BIN"] = write_gh(args.gh, faults_from(args), args.size)
+    for key, value in sorted(environment.items()):
+        print("export %s=%s" % (key, value))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+# Independent phases of a plugin run, side by side, under one deadline.
+#
+# A plugin describes its work as phases, each naming the phases it needs.
+# Each phase starts once those are done, on its own thread, and the whole
+# run gets ``deadline`` seconds.  A phase that fails or isn't done by then
+# is replaced by its last good result, kept on disk from earlier runs, and
+# reported as stale; with no last good result it gets its default.  Phases
+# that need a stale phase are run on its stale result, and those that need a
+# defaulted one aren't run at all.
+#
+# Worker threads are daemons, but that alone doesn't let the plugin exit on
+# time: the interpreter joins every thread pool's workers at exit, so a
+# phase that overran with a pool of its own (gh calls, say) would hold the
+# process, and BitBar waiting on it, until the phase finished.  Plugins end
+# with finish() once the menu is out.  Under the resident daemon, which
+# doesn't exit, a late phase's result is still kept for next time once it
+# lands.
+
+import json
+import os
+import sys
+import threading
+import time
+
+from homebar import menus
+
+DEADLINE = 8
+
+
+class Phase(object):
+    def __init__(self, name, fn, needs=(), default=None, dump=None, load=None):
+        """``fn`` is called with the results of ``needs``, in order.
+
+        ``dump``/``load`` turn the result into JSON data and back, for
+        keeping it as the last good result.
+        """
+        self.name = name
+        self.fn = fn
+        self.needs = tuple(needs)
+        self.default = default
+        self.dump = dump or (lambda value: value)
+        self.load = load or (lambda data: data)
+
+
+class Results(object):
+    def __init__(self):
+        self.values = {}
+        # name -> when its last good result was made (None when defaulted)
+        self.stale = {}
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+
+# Shared by every _LastGood, so a phase keeping its progress (keep) and the
+# run putting another phase's result don't write over each other
+_LOCK = threading.Lock()
+
+
+class _LastGood(object):
+    def __init__(self, path):
+        self.path = path
+        self.lock = _LOCK
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, name):
+        with self.lock:
+            return self._load().get(name)
+
+    def put(self, name, data):
+        with self.lock:
+            entries = self._load()
+            entries[name] = {"at": time.time(), "data": data}
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = "%s.%d.%d.tmp" % (self.path, os.getpid(), threading.get_ident())
+            with open(tmp, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmp, self.path)
+
+
+def _rate_limited(error):
+    # The schedule holds off on a 429; stale results would hide it
+    return getattr(error, "code", None) == 429
+
+
+def _last_good(plugin_file):
+    return _LastGood(
+        menus.cache_path("phases", menus.plugin_name(plugin_file) + ".json")
+    )
+
+
+def kept(plugin_file, phase):
+    """A phase's last good result, or its default when it has none."""
+    entry = _last_good(plugin_file).get(phase.name)
+    return phase.default if entry is None else phase.load(entry["data"])
+
+
+def keep(plugin_file, phase, value):
+    """Make ``value`` the phase's last good result, e.g. once it has been
+    brought up to date some other way."""
+    _last_good(plugin_file).put(phase.name, phase.dump(value))
+
+
+def run(plugin_file, phases, deadline=DEADLINE):
+    """Run ``phases`` and return their Results within ``deadline`` seconds."""
+    last_good = _last_good(plugin_file)
+    by_name = {phase.name: phase for phase in phases}
+    results = Results()
+    done = threading.Condition()
+    outcomes = {}
+    started = set()
+    ends_at = time.monotonic() + deadline
+
+    def work(phase, args):
+        try:
+            value = phase.fn(*args)
+        except Exception as e:
+            outcome = (False, e)
+        else:
+            outcome = (True, value)
+            try:
+                last_good.put(phase.name, phase.dump(value))
+            except (OSError, TypeError, ValueError):
+                pass
+        with done:
+            outcomes[phase.name] = outcome
+            done.notify_all()
+
+    def settle(name):
+        """Take a phase's outcome, or fall back when it failed or is late."""
+        phase = by_name[name]
+        ok, value = outcomes.get(name, (False, None))
+        if ok:
+            results.values[name] = value
+            return
+        if value is not None and _rate_limited(value):
+            raise value
+        kept = last_good.get(name)
+        if kept is None:
+            results.values[name] = phase.default
+            results.stale[name] = None
+        else:
+            results.values[name] = phase.load(kept["data"])
+            results.stale[name] = kept["at"]
+
+    with done:
+        while True:
+            for phase in phases:
+                if phase.name not in started and all(
+                    need in results.values for need in phase.needs
+                ):
+                    started.add(phase.name)
+                    # Nothing to run it on when a need only has its default
+                    if any(results.stale.get(need, 0) is None for need in phase.needs):
+                        settle(phase.name)
+                        continue
+                    args = [results.values[need] for need in phase.needs]
+                    threading.Thread(
+                        target=work, args=(phase, args), name=phase.name, daemon=True
+                    ).start()
+
+            pending = [name for name in started if name not in results.values]
+            finished = [name for name in pending if name in outcomes]
+            for name in finished:
+                settle(name)
+            if len(results.values) == len(phases):
+                return results
+            if finished:
+                # Their dependents may be ready to start now
+                continue
+
+            remaining = ends_at - time.monotonic()
+            if remaining > 0:
+                done.wait(remaining)
+                continue
+
+            # Out of time: what hasn't finished is stale, and what needs it
+            # starts on the stale result (and is late too)
+            for name in pending:
+                if name not in results.values:
+                    settle(name)
+
+
+def finish(status=0):
+    """End the plugin process now, without waiting on phases still running."""
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except (OSError, ValueError):
+            pass
+    os._exit(status)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+# Local store of annotated GitHub pull requests, keyed by ``PR.key``.
+#
+# A cheap search lists the PRs with their ``updatedAt``; only the ones that
+# are new, changed, or whose details are older than ``max_age`` go through
+# the heavy detail query again.  Everything else is rebuilt from here.
+
+import json
+import os
+import time
+
+
+class PRStore(object):
+    def __init__(self, path):
+        self.path = path
+        self.entries = self._load()
+        self.dirty = False
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def reload(self):
+        """Pick up what another process (homebar.webhook) saved since."""
+        self.entries = self._load()
+        self.dirty = False
+
+    def keys(self):
+        return list(self.entries)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        return entry["pr"] if entry else None
+
+    def node_id(self, key):
+        entry = self.entries.get(key)
+        return entry["id"] if entry else None
+
+    def updated_at(self, key):
+        entry = self.entries.get(key)
+        return entry["updated_at"] if entry else None
+
+    def needs_detail(self, key, updated_at, max_age):
+        entry = self.entries.get(key)
+        if entry is None or entry["updated_at"] != updated_at:
+            return True
+        # updatedAt doesn't move for CI status or mergeability changes, so
+        # details are refreshed every now and then regardless
+        return time.time() - entry["fetched_at"] > max_age
+
+    def put(self, key, node_id, updated_at, pr):
+        self.entries[key] = {
+            "id": node_id,
+            "updated_at": updated_at,
+            "fetched_at": time.time(),
+            "pr": pr,
+        }
+        self.dirty = True
+
+    def drop(self, key):
+        if self.entries.pop(key, None) is not None:
+            self.dirty = True
+
+    def retain(self, keys):
+        """Forget every PR not in ``keys``."""
+        for key in set(self.entries) - set(keys):
+            del self.entries[key]
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.path)
+        self.dirty = False
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+# Record and replay of everything the plugins fetch.
+#
+#   HOMEBAR_RECORD=fixtures.jsonl ./github-review-requests.5m.py
+#   HOMEBAR_REPLAY=fixtures.jsonl ./github-review-requests.5m.py
+#
+# Recording appends one JSON line per HTTP response (GitHub GraphQL,
+# CircleCI, Jira) and per command run (``gh pr list``).  Replaying serves
+# those lines back, in order, for the same request, without touching the
+# network or spawning anything.  Credentials are never written: fixtures are
+# keyed on the method, the URL without its secrets, and a hash of the body.
+
+import hashlib
+import json
+import os
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query string parameters that carry credentials
+SECRET_PARAMS = ("circle-token", "token", "access_token")
+
+_lock = threading.Lock()
+_replay = None
+
+
+class MissingFixture(LookupError):
+    pass
+
+
+def recording():
+    return bool(os.environ.get("HOMEBAR_RECORD"))
+
+
+def replaying():
+    return bool(os.environ.get("HOMEBAR_REPLAY"))
+
+
+def _redact(url):
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k not in SECRET_PARAMS]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def http_key(method, url, body=None):
+    digest = hashlib.sha256(body or b"").hexdigest()[:16]
+    return "%s %s %s" % (method, _redact(url), digest)
+
+
+def command_key(argv):
+    # By the program's name, not its path, so fixtures recorded against one
+    # gh replay against another
+    return " ".join([os.path.basename(argv[0])] + list(argv[1:]))
+
+
+def _append(kind, key, payload):
+    line = json.dumps({"kind": kind, "key": key, "payload": payload})
+    with _lock:
+        with open(os.environ["HOMEBAR_RECORD"], "a") as f:
+            f.write(line + "\n")
+
+
+def _load_replay():
+    global _replay
+    if _replay is None:
+        fixtures = {}
+        with open(os.environ["HOMEBAR_REPLAY"], "r") as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    fixtures.setdefault((item["kind"], item["key"]), []).append(
+                        item["payload"]
+                    )
+        _replay = fixtures
+    return _replay
+
+
+def _next(kind, key):
+    """The next recorded payload for a request; the last one repeats."""
+    with _lock:
+        payloads = _load_replay().get((kind, key))
+        if not payloads:
+            raise MissingFixture("No %s fixture for %s" % (kind, key))
+        return payloads.pop(0) if len(payloads) > 1 else payloads[0]
+
+
+def record_http(method, url, body, response):
+    _append(
+        "http",
+        http_key(method, url, body),
+        {
+            "status": response.status,
+            "headers": response.headers,
+            "body": response.body.decode("utf-8"),
+        },
+    )
+
+
+def replay_http(method, url, body):
+    """(status, headers, body) recorded for this request."""
+    payload = _next("http", http_key(method, url, body))
+    return payload["status"], payload["headers"], payload["body"].encode("utf-8")
+
+
+def run(argv, timeout=None):
+    """subprocess.run(argv, capture_output=True), recorded or replayed."""
+    import subprocess
+
+    key = command_key(argv)
+    if replaying():
+        payload = _next("command", key)
+        return subprocess.CompletedProcess(
+            argv,
+            payload["returncode"],
+            payload["stdout"].encode("utf-8"),
+            payload["stderr"].encode("utf-8"),
+        )
+
+    proc = subprocess.run(argv, capture_output=True, timeout=timeout)
+    if recording():
+        _append(
+            "command",
+            key,
+            {
+                "returncode": proc.returncode,
+                "stdout": proc.stdout.decode("utf-8", "replace"),
+                "stderr": proc.stderr.decode("utf-8", "replace"),
+            },
+        )
+    return proc
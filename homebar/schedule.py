@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+# Adaptive refresh schedule for the network plugins.
+#
+# BitBar's file name fixes how often a plugin is *started*; this decides how
+# often it actually goes to the network.  Each plugin records what it fetched
+# (so we know how often its data really changes), whether something is in
+# flight (a running build, a pending check), and what the API said about its
+# quota.  From that it gets a next due time:
+#
+# * busy            -> poll at min_interval (the daemon honours this; plain
+#                      BitBar can't start us more often than the file name)
+# * quota running low or Retry-After -> hold off until the API allows it
+# * data idle for a while -> back off towards max_interval
+# * changes pushed to the plugin (homebar.webhook) -> only reconcile now and
+#                      then
+# * otherwise       -> the file name's interval
+#
+# A tick that isn't due just prints the last rendered menu.
+
+import hashlib
+import json
+import os
+import time
+
+from homebar import menus, metrics, singleflight
+
+# Below these fractions of the quota, slow down / wait for the reset
+LOW_QUOTA = 0.25
+EXHAUSTED_QUOTA = 0.05
+
+# Back off once the data has been idle this many intervals, and never poll
+# less often than MAX_INTERVALS intervals
+IDLE_INTERVALS = 4
+MAX_INTERVALS = 4
+
+# Busy plugins poll this many times per interval, but not below MIN_SECONDS
+BUSY_SPEEDUP = 4
+MIN_SECONDS = 15
+
+
+def _state_path(plugin_file):
+    return menus.cache_path("schedule", menus.plugin_name(plugin_file) + ".json")
+
+
+def fingerprint(data):
+    text = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class Schedule(object):
+    def __init__(self, plugin_file, min_interval=None, max_interval=None):
+        self.plugin_file = plugin_file
+        self.interval = menus.interval(plugin_file) or 60
+        self.min_interval = min_interval or max(
+            MIN_SECONDS, self.interval // BUSY_SPEEDUP
+        )
+        self.max_interval = max_interval or self.interval * MAX_INTERVALS
+        self.state = self._load()
+        self.started_at = None
+
+    def _load(self):
+        try:
+            with open(_state_path(self.plugin_file), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        path = _state_path(self.plugin_file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, path)
+
+    @property
+    def busy(self):
+        """Whether the last run found something in flight."""
+        return bool(self.state.get("busy"))
+
+    def due(self, now=None):
+        now = time.time() if now is None else now
+        # Allow a little slack so a tick that lands just before the due
+        # time isn't pushed back a whole interval
+        return now + 5 >= self.state.get("next_due", 0)
+
+    def serve_cached(self):
+        """Print the last menu and return True when this tick can be skipped."""
+        if self.due():
+            return False
+        text = menus.read(self.plugin_file)
+        if text is None:
+            return False
+        menus.show(text)
+        return True
+
+    def quota(self, remaining, limit, reset_at):
+        """Record API quota; ``reset_at`` is a unix timestamp."""
+        if remaining is None or not limit:
+            return
+        self.state["quota"] = {
+            "remaining": remaining,
+            "limit": limit,
+            "reset_at": reset_at,
+        }
+        registry = metrics.for_plugin(self.plugin_file)
+        registry.set("homebar_quota_remaining", remaining)
+        registry.set("homebar_quota_limit", limit)
+
+    def quota_from_headers(self, headers):
+        """Record quota from X-RateLimit-* response headers, if present."""
+        try:
+            remaining = int(headers["x-ratelimit-remaining"])
+            limit = int(headers["x-ratelimit-limit"])
+        except (KeyError, TypeError, ValueError):
+            return
+        reset = _number(headers.get("x-ratelimit-reset"))
+        # Some APIs send seconds until the reset, others a unix timestamp
+        if reset is not None and reset < 10**9:
+            reset = time.time() + reset
+        self.quota(remaining, limit, reset)
+
+    def retry_after(self, seconds):
+        retry_at = time.time() + seconds
+        self.state["retry_at"] = retry_at
+        self.state["next_due"] = max(self.state.get("next_due", 0), retry_at)
+        self.save()
+
+    def run(self, render):
+        """Render the plugin through ``render`` unless this tick is skipped.
+
+        Copies started while another one is rendering wait for its menu
+        (see homebar.singleflight).  A 429 from the API is turned into a
+        Retry-After hold-off and the last menu is shown instead.  Either way
+        the run is counted in the plugin's metrics (see homebar.metrics).
+        """
+        # Another process (or the daemon) may have run since we loaded
+        self.state = self._load()
+        if self.serve_cached():
+            return
+        registry = metrics.for_plugin(self.plugin_file)
+        self.started_at = time.time()
+        try:
+            singleflight.run(self.plugin_file, render)
+            registry.inc("homebar_runs_total")
+        except Exception as e:
+            registry.inc("homebar_run_errors_total", {"error": type(e).__name__})
+            if not isinstance(e, OSError) or getattr(e, "code", None) != 429:
+                raise
+            headers = getattr(e, "headers", None) or {}
+            self.retry_after(_number(headers.get("retry-after")) or self.interval)
+            if not self.serve_cached():
+                raise
+        finally:
+            try:
+                registry.write()
+            except OSError:
+                pass
+
+    def record(self, data, busy=False, now=None, reconcile=None):
+        """Note what this run fetched and work out when the next one is due.
+
+        The next run is due an interval after this one started (see run), not
+        after it finished, so slow fetches don't push every tick back.
+        ``reconcile`` is how often to poll (in seconds) while changes are
+        being pushed to the plugin, just to catch what the pushes missed.
+        """
+        now = time.time() if now is None else now
+        digest = fingerprint(data)
+        if digest != self.state.get("hash"):
+            self.state["hash"] = digest
+            self.state["changed_at"] = now
+        self.state["busy"] = busy
+        self.state["reconcile"] = reconcile
+        self.state["ran_at"] = now
+        started = min(self.started_at or now, now)
+        self.state["next_due"] = started + self.next_interval(now)
+        self.save()
+
+    def next_interval(self, now=None):
+        now = time.time() if now is None else now
+        state = self.state
+
+        interval = self.interval
+        if state.get("busy"):
+            interval = self.min_interval
+        else:
+            idle = now - state.get("changed_at", now)
+            if idle > IDLE_INTERVALS * self.interval:
+                interval = min(self.max_interval, idle / IDLE_INTERVALS)
+        if state.get("reconcile"):
+            interval = max(interval, state["reconcile"])
+
+        quota = state.get("quota")
+        if quota:
+            left = float(quota["remaining"]) / quota["limit"]
+            until_reset = max(0, (quota.get("reset_at") or now) - now)
+            if left < EXHAUSTED_QUOTA:
+                interval = max(interval, until_reset)
+            elif left < LOW_QUOTA:
+                interval = max(interval, self.interval * MAX_INTERVALS)
+
+        retry_at = state.get("retry_at")
+        if retry_at and retry_at > now:
+            interval = max(interval, retry_at - now)
+
+        return interval
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def next_due(plugin_file):
+    """When the plugin wants to run next, or None if it keeps no schedule."""
+    try:
+        with open(_state_path(plugin_file), "r") as f:
+            return json.load(f).get("next_due")
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+# One fetch at a time per plugin, across processes.
+#
+# BitBar happily starts a second copy of a plugin while the first is still
+# fetching (a slow API, "Refresh all").  The first copy takes the plugin's
+# lock file and renders; later copies wait for it to let go, up to DEADLINE
+# seconds, and print the menu it left behind instead of calling the API
+# again.  If it fails or runs out the clock, they print the last good menu.
+
+import contextlib
+import fcntl
+import os
+import time
+
+from homebar import menus
+
+# How long a waiting copy holds on for the one that's fetching
+DEADLINE = 20
+POLL = 0.1
+
+
+def _lock_path(plugin_file):
+    return menus.cache_path("locks", menus.plugin_name(plugin_file) + ".lock")
+
+
+def _try_lock(f):
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+@contextlib.contextmanager
+def held(plugin_file):
+    """Hold the plugin's lock, waiting for a render in progress to finish."""
+    path = _lock_path(plugin_file)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def run(plugin_file, render, deadline=DEADLINE):
+    """menus.emit(plugin_file, render), unless another process already is."""
+    path = _lock_path(plugin_file)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    started = time.time()
+    with open(path, "a") as lock:
+        if _try_lock(lock):
+            try:
+                menus.emit(plugin_file, render)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            return
+
+        while time.time() - started < deadline:
+            time.sleep(POLL)
+            if _try_lock(lock):
+                fcntl.flock(lock, fcntl.LOCK_UN)
+                break
+
+    text = menus.read(plugin_file)
+    if text is None:
+        # Nothing to fall back on; better late than an empty menu
+        menus.emit(plugin_file, render)
+        return
+    menus.show(text)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+# Streaming mode for plugins whose menu is cheap to compute.
+#
+# SwiftBar can keep a plugin marked ``<swiftbar.type>streamable</swiftbar.type>``
+# running and read menus from its stdout, one after another, each starting
+# with a ``~~~`` line.  A plugin in this mode stays resident, sleeps until
+# its menu can next change, and prints it only when it actually did, instead
+# of paying for a fresh interpreter on every tick.
+#
+#   ./pomodoro.1m.py --stream        # or run by SwiftBar (SWIFTBAR=1)
+#
+# Like menus, this is imported before the plugin decides what to do, so it
+# sticks to the standard library.
+
+import os
+import sys
+import time
+
+from homebar import menus
+
+SEPARATOR = "~~~"
+
+
+def enabled():
+    """Whether this process should stream rather than print one menu."""
+    return "--stream" in sys.argv[1:] or os.environ.get("SWIFTBAR") == "1"
+
+
+def run(render, wait, sleep=time.sleep):
+    """Print ``render``'s menu whenever it changes, forever.
+
+    ``wait()`` gives the seconds until the menu might next change; the
+    loop sleeps that long between renders.
+    """
+    last = None
+    while True:
+        text = menus.capture(render)
+        if text != last:
+            sys.stdout.write(SEPARATOR + "\n" + text)
+            sys.stdout.flush()
+            last = text
+        sleep(max(0.0, wait()))
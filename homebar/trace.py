@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+# Where a plugin's time goes.
+#
+#   HOMEBAR_TRACE=1 ./github-review-requests.5m.py
+#
+# Plugins wrap their phases (fetches, subprocesses, drawing) in spans.  With
+# HOMEBAR_TRACE set, every run appends its spans to .cache/trace.jsonl,
+# rotated at MAX_BYTES, and ends its menu with a Diagnostics submenu: this
+# run's breakdown and the slowest phases of the past day.  Without it, spans
+# are a shared no-op and timed functions are left undecorated.
+
+import functools
+import json
+import os
+import threading
+import time
+
+from homebar import menus
+
+ENABLED = bool(os.environ.get("HOMEBAR_TRACE"))
+
+# The log is moved aside to trace.jsonl.1 once it grows past this
+MAX_BYTES = 1 << 20
+
+# Phases listed under "Slowest today"
+SLOWEST = 5
+DAY = 86400
+
+
+def log_path():
+    return menus.cache_path("trace.jsonl")
+
+
+class _NoSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span(object):
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.tracer.spans.append(
+            {
+                "name": self.name,
+                "start": self.start,
+                "seconds": time.perf_counter() - self.started,
+                "thread": threading.current_thread().name,
+                "error": exc_type is not None,
+            }
+        )
+        return False
+
+
+class Tracer(object):
+    def __init__(self, plugin_file, enabled=None):
+        self.plugin = menus.plugin_name(plugin_file)
+        self.enabled = ENABLED if enabled is None else enabled
+        self.spans = []
+
+    def span(self, name):
+        return _Span(self, name) if self.enabled else _NO_SPAN
+
+    def timed(self, name=None):
+        """Decorator putting each call of the function in a span."""
+
+        def decorate(fn):
+            if not self.enabled:
+                return fn
+            label = name or fn.__name__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with _Span(self, label):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorate
+
+    def report(self):
+        """Log the spans so far and print the Diagnostics submenu."""
+        if not self.enabled:
+            return
+        spans, self.spans = self.spans, []
+        now = time.time()
+        _append(self.plugin, now, spans)
+        _print_diagnostics(spans, slowest(self.plugin, now - DAY))
+
+
+def _append(plugin, run, spans):
+    path = log_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        if os.path.getsize(path) > MAX_BYTES:
+            os.replace(path, path + ".1")
+    except OSError:
+        pass
+    lines = "".join(
+        json.dumps(dict(span, plugin=plugin, run=run)) + "\n" for span in spans
+    )
+    with open(path, "a") as f:
+        f.write(lines)
+
+
+def _read(since):
+    for path in (log_path() + ".1", log_path()):
+        try:
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        span = json.loads(line)
+                    except ValueError:
+                        continue
+                    if span["start"] >= since:
+                        yield span
+        except OSError:
+            continue
+
+
+def slowest(plugin, since, count=SLOWEST):
+    """The ``count`` slowest phases of ``plugin`` since then, as spans."""
+    worst = {}
+    for span in _read(since):
+        if span["plugin"] != plugin:
+            continue
+        if span["seconds"] > worst.get(span["name"], {"seconds": -1})["seconds"]:
+            worst[span["name"]] = span
+    return sorted(worst.values(), key=lambda s: -s["seconds"])[:count]
+
+
+def _breakdown(spans):
+    totals = {}
+    for span in spans:
+        seconds, calls = totals.get(span["name"], (0.0, 0))
+        totals[span["name"]] = (seconds + span["seconds"], calls + 1)
+    return sorted(totals.items(), key=lambda item: -item[1][0])
+
+
+def _ms(seconds):
+    return "%.0f ms" % (seconds * 1000)
+
+
+def _print_diagnostics(spans, worst):
+    print("---")
+    print("Diagnostics")
+    print("--Last run | color=#586069")
+    for name, (seconds, calls) in _breakdown(spans):
+        times = " ×%d" % calls if calls > 1 else ""
+        print("--%s: %s%s | font=Menlo size=11" % (name, _ms(seconds), times))
+    print("-----")
+    print("--Slowest today | color=#586069")
+    for span in worst:
+        when = time.strftime("%H:%M", time.localtime(span["start"]))
+        print(
+            "--%s: %s at %s | font=Menlo size=11"
+            % (span["name"], _ms(span["seconds"]), when)
+        )
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+# Local receiver for GitHub webhooks, so changes are pushed instead of polled.
+#
+#   GITHUB_WEBHOOK_SECRET=... python3 -m homebar.webhook --port 8977
+#   gh webhook forward --repo org/repo --url http://localhost:8977/ \
+#       --events pull_request,pull_request_review,status --secret ...
+#
+# Run it from the plugin directory, next to the resident daemon if there is
+# one.  It loads the GitHub plugin and hands it every ``pull_request``,
+# ``pull_request_review`` and ``status`` event whose X-Hub-Signature-256
+# matches GITHUB_WEBHOOK_SECRET (see the plugin's apply_event); when the
+# event changed what the menu shows, the menu is redrawn from the plugin's
+# stored state, without searching, and kept for BitBar to pick up.  While
+# the receiver is up the plugin only polls every RECONCILE_SECONDS or so, to
+# catch what the relay missed.
+#
+# The plugin imports this module on every run (see running), so it keeps
+# its own imports light.  Recorded payloads can be replayed against it:
+#
+#   python3 -m homebar.webhook send pull_request payload.json --port 8977
+
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+
+from homebar import menus
+
+PORT = 8977
+PLUGIN = "github-review-requests.5m.py"
+EVENTS = ("pull_request", "pull_request_review", "status")
+
+
+def _pid_path():
+    return menus.cache_path("webhook.pid")
+
+
+def running():
+    """Whether a receiver is up, and so changes are being pushed."""
+    try:
+        with open(_pid_path(), "r") as f:
+            pid = int(f.read().strip())
+        os.kill(pid, 0)
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+def signature(secret, body):
+    digest = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return "sha256=" + digest
+
+
+def verified(secret, body, header):
+    return bool(header) and hmac.compare_digest(signature(secret, body), header)
+
+
+def _log(message):
+    sys.stderr.write("%s %s\n" % (time.strftime("%Y-%m-%d %H:%M:%S"), message))
+    sys.stderr.flush()
+
+
+def serve(plugin, secret, port=PORT):
+    """Answer webhooks on localhost:``port`` until interrupted.
+
+    Events are handled one at a time, in the order they arrive, each while
+    holding the plugin's lock (see homebar.singleflight) so a poll in
+    progress can't save over it.
+    """
+    import traceback
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    from homebar import singleflight
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, status):
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if not verified(secret, body, self.headers.get("X-Hub-Signature-256")):
+                self._reply(401)
+                return
+            event = self.headers.get("X-GitHub-Event")
+            if event not in EVENTS:
+                # Including the ping sent when a hook is set up
+                self._reply(204)
+                return
+            try:
+                payload = json.loads(body)
+                with singleflight.held(plugin.path):
+                    if plugin.module.apply_event(event, payload):
+                        text = menus.capture(plugin.module.render_pushed)
+                        menus.write(plugin.path, text)
+            except Exception:
+                _log("%s event failed\n%s" % (event, traceback.format_exc()))
+                self._reply(500)
+                return
+            self._reply(202)
+
+    server = HTTPServer(("127.0.0.1", port), Handler)
+    path = _pid_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(str(os.getpid()))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def send(event, payload_file, secret, port=PORT):
+    """Post a recorded payload to a receiver, signed like GitHub does."""
+    from homebar import client
+
+    with open(payload_file, "rb") as f:
+        body = f.read()
+    try:
+        response = client.request(
+            "POST",
+            "http://127.0.0.1:%d/" % port,
+            body=body,
+            headers={
+                "Content-Type": "application/json",
+                "X-GitHub-Event": event,
+                "X-Hub-Signature-256": signature(secret, body),
+            },
+        )
+    except client.HTTPError as e:
+        return e.code
+    return response.status
+
+
+def main(argv=None):
+    import argparse
+
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(prog="python3 -m homebar.webhook")
+    parser.add_argument("--port", type=int, default=PORT)
+    if argv[:1] == ["send"]:
+        parser.add_argument("event", choices=EVENTS)
+        parser.add_argument("payload", help="JSON payload as GitHub sends it")
+        args = parser.parse_args(argv[1:])
+    else:
+        args = parser.parse_args(argv)
+
+    from homebar import config, daemon
+
+    directory = menus.plugin_directory()
+    config.load_env(os.path.join(directory, ".credentials.env"))
+    secret = os.environ.get("GITHUB_WEBHOOK_SECRET")
+    if not secret:
+        sys.exit("GITHUB_WEBHOOK_SECRET is not set")
+
+    if argv[:1] == ["send"]:
+        print(send(args.event, args.payload, secret, port=args.port))
+        return
+
+    plugin = daemon.Plugin(os.path.join(directory, PLUGIN))
+    plugin.load()
+    serve(plugin, secret, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
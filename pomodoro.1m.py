@@ -12,6 +12,7 @@
 # <bitbar.author.github> </bitbar.author.github>
 # <bitbar.image> </bitbar.image>
 # <bitbar.dependencies>python</bitbar.dependencies>
+# <swiftbar.type>streamable</swiftbar.type>
 
 # ----------------------
 # ---  BEGIN CONFIG  ---
@@ -21,13 +22,22 @@
 # ---  END CONFIG  ---
 # --------------------
 
+import sys
+
+from homebar import menus, stream
+
+# While the resident daemon (python3 -m homebar.daemon) is up, print the menu
+# it already rendered instead of paying for the imports and work below
+if (
+    __name__ == "__main__"
+    and not stream.enabled()
+    and menus.serve_resident(__file__)
+):
+    sys.exit(0)
+
 import datetime
 from datetime import timedelta
 import os
-import locale
-import codecs
-import random
-import sys
 
 
 DARK_MODE = os.environ.get("BitBarDarkMode")
@@ -69,10 +79,18 @@ def _time(t):
     return datetime.datetime.strftime(t, "%I:%M %p")
 
 
-if __name__ == "__main__":
-    start = datetime.datetime(2021, 1, 1)
+def _elapsed(now):
+    return (now - datetime.datetime(2021, 1, 1)).total_seconds()
+
+
+def until_next_minute():
+    """Seconds until the countdown, and so the menu, next changes."""
+    return 60 - _elapsed(datetime.datetime.now()) % 60
+
+
+def main():
     now = datetime.datetime.now()
-    delta = (now - start).total_seconds()
+    delta = _elapsed(now)
     interval = int(delta / (15 * 60))
     left = 15 - int((delta / 60) % 15)
 
@@ -96,3 +114,10 @@ if __name__ == "__main__":
             continue
         print_line("  %s %s" % (start_time, _mode(interval + m)))
         tt = tt + timedelta(minutes=15)
+
+
+if __name__ == "__main__":
+    if stream.enabled():
+        stream.run(main, until_next_minute)
+    else:
+        main()
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+import pytest
+
+# The plugin directory, where homebar lives
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from homebar import bench, mockapi  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Plugin state for the test alone."""
+    path = tmp_path / ".cache"
+    monkeypatch.setenv("HOMEBAR_CACHE_DIR", str(path))
+    for key in ("HOMEBAR_RECORD", "HOMEBAR_REPLAY", "HOMEBAR_METRICS_DIR"):
+        monkeypatch.delenv(key, raising=False)
+    return path
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """The stand-ins in homebar.mockapi, answering at once, with the
+    plugins pointed at them."""
+    server = mockapi.Server(
+        mockapi.Datasets(20),
+        {
+            name: mockapi.Faults(latency_ms=0, seed=0)
+            for name in ("github", "circleci", "jira")
+        },
+    ).start()
+    for key, value in bench.ENVIRONMENT.items():
+        monkeypatch.setenv(key, value)
+    for key, value in server.environment().items():
+        monkeypatch.setenv(key, value)
+    yield server
+    server.shutdown()
+    server.server_close()
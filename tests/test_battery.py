@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import os
+import subprocess
+import time
+
+import pytest
+
+from homebar import menus
+
+SCRIPT = os.path.join(menus.plugin_directory(), "ColorfulBatteryLevel.5s.sh")
+
+PMSET = (
+    "Now drawing from 'Battery Power'\n"
+    " -InternalBattery-0 (id=1234)\t85%; discharging; 3:20 remaining present: true\n"
+)
+
+PROFILE = """Power:
+
+    Battery Information:
+
+      Health Information:
+          Cycle Count: %d
+          Condition: Normal
+"""
+
+
+@pytest.fixture
+def probes(tmp_path):
+    """Recorded pmset and system_profiler output; the profiler's runs are
+    counted in ``calls``."""
+    (tmp_path / "pmset.txt").write_text(PMSET)
+    (tmp_path / "profile.txt").write_text(PROFILE % 312)
+    profiler = tmp_path / "profiler.sh"
+    profiler.write_text(
+        'echo run >> "%s"\ncat "%s"\n' % (tmp_path / "calls", tmp_path / "profile.txt")
+    )
+    return tmp_path
+
+
+def _calls(probes):
+    try:
+        return len((probes / "calls").read_text().splitlines())
+    except OSError:
+        return 0
+
+
+def _run(probes, slow_ttl=3600):
+    env = dict(
+        os.environ,
+        PMSET_CMD="cat %s" % (probes / "pmset.txt"),
+        SYSTEM_PROFILER_CMD="sh %s" % (probes / "profiler.sh"),
+        SLOW_TTL=str(slow_ttl),
+    )
+    return subprocess.run(
+        ["bash", SCRIPT], env=env, capture_output=True, check=True, text=True
+    ).stdout
+
+
+def test_menu_from_one_pmset_run(probes):
+    out = _run(probes)
+    assert "Current charge: 85%" in out
+    assert "Status: Discharging" in out
+    assert "Time remaining: 3:20" in out
+    assert "Cycles: 312" in out
+    assert "Condition: Normal" in out
+
+
+def test_slow_fields_come_from_the_cache(probes):
+    _run(probes)
+    (probes / "profile.txt").write_text(PROFILE % 313)
+    assert "Cycles: 312" in _run(probes)
+    assert _calls(probes) == 1
+
+
+def test_stale_slow_fields_are_refreshed_in_the_background(probes):
+    _run(probes)
+    (probes / "profile.txt").write_text(PROFILE % 313)
+
+    # Served from the cache as it was, while it is refreshed
+    assert "Cycles: 312" in _run(probes, slow_ttl=0)
+    give_up = time.time() + 10
+    while "Cycles: 313" not in _run(probes):
+        assert time.time() < give_up, "not refreshed"
+        time.sleep(0.05)
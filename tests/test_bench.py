@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from homebar import bench
+
+
+@pytest.fixture(autouse=True)
+def environment(monkeypatch):
+    for key, value in bench.ENVIRONMENT.items():
+        monkeypatch.setenv(key, value)
+
+
+@pytest.mark.parametrize("plugin", sorted(bench.IMPORT_BUDGETS))
+def test_plugin_imports_within_budget(plugin):
+    cost, top = bench.import_cost(plugin, repeat=3)
+    heaviest = ", ".join("%s %.1f" % (name, ms) for ms, name in top[:3])
+    assert cost <= bench.IMPORT_BUDGETS[plugin], heaviest
+
+
+def test_check_fails_when_a_plugin_is_over_budget(monkeypatch, capsys):
+    monkeypatch.setattr(bench, "IMPORT_BUDGETS", {"pomodoro.1m.py": 0})
+    assert not bench.check_imports(1)
+    assert "OVER 0 ms" in capsys.readouterr().out
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import json
+import sqlite3
+import time
+
+from homebar import buildstore
+
+
+def _ago(days):
+    return time.strftime(
+        "%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(time.time() - days * 86400)
+    )
+
+
+def _build(build_num, committer_days=None, queued_days=None, branch="main"):
+    return {
+        "reponame": "repo",
+        "build_num": build_num,
+        "branch": branch,
+        "workflows": {"job_name": "test"},
+        "user": {"login": "me"},
+        "status": "success",
+        "outcome": "success",
+        "committer_date": None if committer_days is None else _ago(committer_days),
+        "queued_at": None if queued_days is None else _ago(queued_days),
+    }
+
+
+def _store(tmp_path, builds):
+    store = buildstore.BuildStore(str(tmp_path / "builds.sqlite"))
+    store.add(builds)
+    store.prune()
+    store.commit()
+    return store
+
+
+def _numbers(store, days=14):
+    return sorted(b["build_num"] for b in store.latest("me", days))
+
+
+def test_rebuild_of_an_old_commit_is_recent(tmp_path):
+    store = _store(tmp_path, [_build(1, committer_days=200, queued_days=0)])
+    assert _numbers(store) == [1]
+
+
+def test_builds_without_dates_are_kept(tmp_path):
+    store = _store(tmp_path, [_build(1)])
+    assert _numbers(store) == [1]
+
+
+def test_old_builds_leave_the_menu_then_the_store(tmp_path):
+    store = _store(
+        tmp_path,
+        [
+            _build(1, committer_days=1, queued_days=30, branch="a"),
+            _build(2, committer_days=1, queued_days=100, branch="b"),
+        ],
+    )
+    assert _numbers(store) == []
+    assert _numbers(store, days=buildstore.RETENTION_DAYS) == [1]
+
+
+def test_store_from_before_built_at_is_migrated(tmp_path):
+    path = str(tmp_path / "builds.sqlite")
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE builds (reponame TEXT NOT NULL, build_num INTEGER NOT NULL, "
+        "branch TEXT, job_name TEXT, login TEXT, status TEXT, outcome TEXT, "
+        "vcs_revision TEXT, committer_date TEXT, build_time_millis INTEGER, "
+        "data TEXT NOT NULL, PRIMARY KEY (reponame, build_num))"
+    )
+    build = _build(1, committer_days=200, queued_days=0)
+    db.execute(
+        "INSERT INTO builds VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        ("repo", 1, "main", "test", "me", "success", "success", None)
+        + (build["committer_date"], None, json.dumps(build)),
+    )
+    db.commit()
+    db.close()
+
+    assert _numbers(buildstore.BuildStore(path)) == [1]
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import json
+import time
+
+from homebar import cache, client
+
+
+def _url(api):
+    return api.url + "/rest/api/3/search?jql=assignee%3Dme"
+
+
+def _requests(api):
+    return dict(api.stats.rows()).get(("jira", "200"), 0)
+
+
+def _age(responses, url, seconds):
+    """Make the cached entry for ``url`` that much older."""
+    path = responses._path(cache.fingerprint(url))
+    with open(path, "r") as f:
+        entry = json.load(f)
+    entry["stored_at"] -= seconds
+    with open(path, "w") as f:
+        json.dump(entry, f)
+
+
+def test_fresh_entry_is_served_without_a_request(api, tmp_path):
+    responses = cache.ResponseCache(str(tmp_path / "responses"), ttl=60)
+    first = responses.fetch(_url(api))
+    second = responses.fetch(_url(api))
+    assert second.json() == first.json()
+    assert not second.stale
+    assert _requests(api) == 1
+
+
+def test_stale_entry_is_revalidated_before_it_is_served(api, tmp_path):
+    responses = cache.ResponseCache(str(tmp_path / "responses"), ttl=60)
+    responses.fetch(_url(api))
+    _age(responses, _url(api), 120)
+    api.datasets.jira = []
+
+    revalidated = responses.fetch(_url(api))
+    assert not revalidated.stale
+    assert revalidated.json()["total"] == 0
+    assert _requests(api) == 2
+
+
+def test_slow_revalidation_serves_stale_then_finishes_in_background(
+    api, tmp_path, monkeypatch
+):
+    responses = cache.ResponseCache(str(tmp_path / "responses"), ttl=60)
+    responses.fetch(_url(api))
+    _age(responses, _url(api), 120)
+    api.datasets.jira = []
+    api.faults["jira"].latency_ms = api.faults["jira"].p99_ms = 1000
+    monkeypatch.setattr(cache, "STALE_DEADLINE", 0.2)
+
+    started = time.monotonic()
+    stale = responses.fetch(_url(api))
+    assert time.monotonic() - started < 1
+    assert stale.stale
+    assert stale.json()["total"] == 20
+
+    # Revalidated by a detached process, for the next fetch to pick up
+    key = cache.fingerprint(_url(api))
+    give_up = time.time() + 10
+    while time.time() - responses._load(key)["stored_at"] > 60:
+        assert time.time() < give_up, "not revalidated"
+        time.sleep(0.05)
+    fresh = responses.fetch(_url(api))
+    assert not fresh.stale
+    assert fresh.json()["total"] == 0
+
+
+def test_last_good_body_is_served_when_the_api_fails(api, tmp_path, monkeypatch):
+    monkeypatch.setattr(client, "BACKOFF", 0)
+    responses = cache.ResponseCache(str(tmp_path / "responses"), ttl=0, max_stale=0)
+    responses.fetch(_url(api))
+    api.faults["jira"].error_rate = 1
+
+    fallback = responses.fetch(_url(api))
+    assert fallback.stale
+    assert fallback.json()["total"] == 20
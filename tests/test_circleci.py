@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from homebar import bench, menus
+
+NOW = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+
+
+def _build(reponame, build_num, status="success"):
+    return {
+        "reponame": reponame,
+        "build_num": build_num,
+        "branch": "main",
+        "workflows": {"job_name": "test-%d" % build_num},
+        "user": {"login": "gcmannb"},
+        "status": status,
+        "outcome": "success" if status == "success" else None,
+        "committer_date": NOW,
+        "queued_at": NOW,
+        "build_url": "https://circleci.com/gh/org/%s/%d" % (reponame, build_num),
+    }
+
+
+def _plugin(monkeypatch):
+    monkeypatch.delenv("CIRCLECI_PROJECTS", raising=False)
+    circleci = bench.load_plugin("circleci")
+    # Every page goes to the stand-in
+    circleci.RESPONSE_CACHE.ttl = circleci.RESPONSE_CACHE.max_stale = 0
+    return circleci
+
+
+def _status(builds, reponame, build_num):
+    for build in builds:
+        if build.build_url.endswith("/%s/%d" % (reponame, build_num)):
+            return build.status
+    return None
+
+
+def test_running_build_buried_by_another_repo_is_fetched_again(api, monkeypatch):
+    circleci = _plugin(monkeypatch)
+    older = [_build("b", n) for n in range(150, 0, -1)]
+    api.datasets.circleci = older + [_build("a", 500, status="running")]
+    assert _status(circleci.execute_query(), "a", 500) == "running"
+
+    # Fifty new builds of b, and a finished, three pages back
+    newer = [_build("b", n) for n in range(200, 150, -1)]
+    api.datasets.circleci = newer + older + [_build("a", 500)]
+    builds = circleci.execute_query()
+    assert _status(builds, "a", 500) == "success"
+    assert _status(builds, "b", 200) == "success"
+
+
+def test_paging_stops_at_what_the_store_has(api, monkeypatch):
+    circleci = _plugin(monkeypatch)
+    api.datasets.circleci = [_build("b", n) for n in range(300, 0, -1)]
+    circleci.execute_query()
+
+    api.datasets.circleci = [_build("b", n) for n in range(310, 0, -1)]
+    before = dict(api.stats.rows())[("circleci", "200")]
+    circleci.execute_query()
+    assert dict(api.stats.rows())[("circleci", "200")] - before == 1
+
+
+def test_busy_polls_skip_the_response_cache(api, monkeypatch):
+    monkeypatch.delenv("CIRCLECI_PROJECTS", raising=False)
+    circleci = bench.load_plugin("circleci")
+    api.datasets.circleci = [_build("a", 2, status="running"), _build("a", 1)]
+
+    def requests():
+        menus.capture(circleci.render)
+        return dict(api.stats.rows())[("circleci", "200")]
+
+    first = requests()
+    assert circleci.SCHEDULE.busy
+    api.datasets.circleci = [_build("a", 2), _build("a", 1)]
+    assert requests() == first + 1
+    assert not circleci.SCHEDULE.busy
+
+    # Within the ttl, and nothing running any more
+    assert requests() == first + 1
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from homebar import client
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Answers each request with the next of the server's ``replies``:
+    (status, body, seconds to wait first)."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(dict(self.headers))
+            server.ports.append(self.client_address[1])
+            status, body, delay = (
+                server.replies.pop(0) if server.replies else (200, b"", 0)
+            )
+        time.sleep(delay)
+        headers = {}
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = []
+    server.ports = []
+    server.replies = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.url = "http://127.0.0.1:%d/" % server.server_address[1]
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(client, "BACKOFF", 0)
+
+
+def test_transient_failures_are_retried(server):
+    server.replies = [(503, b"", 0), (502, b"", 0), (200, b"ok", 0)]
+    response = client.Client().get(server.url)
+    assert response.status == 200
+    assert response.body == b"ok"
+    assert len(server.requests) == 3
+
+
+def test_retries_are_bounded(server):
+    server.replies = [(503, b"", 0)] * 5
+    with pytest.raises(client.HTTPError) as raised:
+        client.Client(retries=2).get(server.url)
+    assert raised.value.code == 503
+    assert len(server.requests) == 3
+
+
+def test_client_errors_are_not_retried(server):
+    server.replies = [(401, b"", 0), (200, b"", 0)]
+    with pytest.raises(client.HTTPError) as raised:
+        client.Client().get(server.url)
+    assert raised.value.code == 401
+    assert len(server.requests) == 1
+
+
+def test_slow_response_runs_out_the_deadline(server):
+    server.replies = [(200, b"late", 2)] * 3
+    started = time.monotonic()
+    with pytest.raises(client.DeadlineExceeded):
+        client.Client().request("GET", server.url, deadline=0.3)
+    assert time.monotonic() - started < 1.5
+
+
+def test_responses_are_asked_for_gzipped_and_inflated(server):
+    server.replies = [(200, b"x" * 10000, 0)]
+    response = client.Client().get(server.url)
+    assert server.requests[0]["Accept-Encoding"] == "gzip"
+    assert response.body == b"x" * 10000
+    assert "content-encoding" not in response.headers
+
+
+def test_connections_are_reused(server):
+    pool = client.Client()
+    pool.get(server.url)
+    pool.get(server.url)
+    pool.close()
+    assert len(set(server.ports)) == 1
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import time
+
+from homebar import bench, menus, mockapi, orchestrate, webhook
+
+LOGIN = bench.ENVIRONMENT["GITHUB_USERNAME"]
+
+
+def _plugin(monkeypatch, gh, faults=None):
+    monkeypatch.setenv(
+        "GH_BIN", mockapi.write_gh(gh, faults or mockapi.Faults(latency_ms=0), 5)
+    )
+    github = bench.load_plugin("github")
+    github.ACTIVE_REPO_LIST = ["org/repo-0"]
+    # Every search goes to the stand-in
+    github.RESPONSE_CACHE.ttl = github.RESPONSE_CACHE.max_stale = 0
+    return github
+
+
+def _counting_details(github):
+    """Node ids of every detail query the plugin sends, per query."""
+    fetched = []
+    fetch = github.fetch_pr_details
+
+    def counted(node_ids):
+        if node_ids:
+            fetched.append(sorted(node_ids))
+        return fetch(node_ids)
+
+    github.fetch_pr_details = counted
+    return fetched
+
+
+def _pull(number, repo="org/repo-0", state="open", assignees=(), requested=()):
+    """A webhook's ``pull_request``."""
+    return {
+        "html_url": "https://github.com/%s/pull/%d" % (repo, number),
+        "node_id": "PR_%d" % number,
+        "number": number,
+        "title": "Pushed %d" % number,
+        "draft": False,
+        "state": state,
+        "user": {"login": "alice"},
+        "created_at": "2021-01-01T00:00:00Z",
+        "updated_at": "2021-02-01T00:00:00Z",
+        "head": {"ref": "branch-%d" % number},
+        "base": {"repo": {"full_name": repo}},
+        "mergeable": True,
+        "assignees": [{"login": login} for login in assignees],
+        "requested_reviewers": [{"login": login} for login in requested],
+        "requested_teams": [],
+    }
+
+
+def _mine(github):
+    mine, _ = orchestrate.kept(github.__file__, github.MINE)
+    return sorted(pr.number for pr in mine)
+
+
+def _snapshot_item(github, repo, number):
+    for item_repo, item in orchestrate.kept(github.__file__, github.SNAPSHOT):
+        if (item_repo, item["number"]) == (repo, number):
+            return item
+    return None
+
+
+def _set_status(api, state, number=None):
+    for node in api.datasets.github:
+        if number is None or node["number"] == number:
+            node["commits"]["nodes"][0]["commit"]["status"] = {"state": state}
+
+
+def test_gh_failures_are_forgotten_by_the_next_run(api, tmp_path, monkeypatch):
+    gh = str(tmp_path / "gh")
+    github = _plugin(monkeypatch, gh, mockapi.Faults(latency_ms=0, error_rate=1))
+    assert "Partial results" in menus.capture(github.render)
+
+    # The same module, as the resident daemon keeps it
+    mockapi.write_gh(gh, mockapi.Faults(latency_ms=0), 5)
+    assert "Partial results" not in menus.capture(github.render)
+
+
+def _slow_gh(tmp_path, slow_repo):
+    """A gh that never answers for ``slow_repo`` in time."""
+    fast = mockapi.write_gh(str(tmp_path / "gh-fast"), mockapi.Faults(latency_ms=0), 5)
+    path = tmp_path / "gh"
+    path.write_text(
+        '#!/bin/sh\ncase "$*" in *"%s "*) exec sleep 30;; esac\nexec "%s" "$@"\n'
+        % (slow_repo, fast)
+    )
+    os.chmod(str(path), 0o755)
+
+
+def _snapshot_repos(github):
+    kept = orchestrate.kept(github.__file__, github.SNAPSHOT)
+    return sorted(set(repo for repo, _ in kept))
+
+
+def test_slow_repo_doesnt_cost_the_others(api, tmp_path, monkeypatch):
+    github = _plugin(monkeypatch, str(tmp_path / "gh"))
+    github.ACTIVE_REPO_LIST = ["org/repo-0", "org/slow"]
+    github.PHASE_DEADLINE = 2
+    _slow_gh(tmp_path, "org/slow")
+
+    for _ in range(2):
+        started = time.monotonic()
+        text = menus.capture(github.render)
+        assert time.monotonic() - started < github.PHASE_DEADLINE + 1
+        assert "none yet" not in text
+        assert github.GH_FAILURES == ["org/slow"]
+        assert _snapshot_repos(github) == ["org/repo-0"]
+
+
+def test_repo_that_runs_out_of_time_keeps_its_last_prs(api, tmp_path, monkeypatch):
+    github = _plugin(monkeypatch, str(tmp_path / "gh"))
+    github.PHASE_DEADLINE = 2
+    menus.capture(github.render)
+    before = orchestrate.kept(github.__file__, github.SNAPSHOT)
+
+    _slow_gh(tmp_path, "org/repo-0")
+    text = menus.capture(github.render)
+    assert "Partial results" in text
+    assert orchestrate.kept(github.__file__, github.SNAPSHOT) == before
+
+
+def test_only_new_or_changed_prs_get_their_details(api, tmp_path, monkeypatch):
+    github = _plugin(monkeypatch, str(tmp_path / "gh"))
+    # None waiting on checks, which are refetched every run
+    _set_status(api, "SUCCESS")
+    fetched = _counting_details(github)
+
+    menus.capture(github.render)
+    assert fetched == [sorted(node["id"] for node in api.datasets.github)]
+
+    del fetched[:]
+    menus.capture(github.render)
+    assert fetched == []
+
+    api.datasets.github[3]["updatedAt"] = "2030-01-01T00:00:00Z"
+    menus.capture(github.render)
+    assert fetched == [["PR_3"]]
+
+
+def test_prs_waiting_on_checks_are_refetched_every_run(api, tmp_path, monkeypatch):
+    github = _plugin(monkeypatch, str(tmp_path / "gh"))
+    _set_status(api, "SUCCESS")
+    menus.capture(github.render)
+    number = _mine(github)[0]
+    _set_status(api, "PENDING", number)
+    api.datasets.github[number]["updatedAt"] = "2030-01-01T00:00:00Z"
+    fetched = _counting_details(github)
+
+    menus.capture(github.render)
+    assert github.SCHEDULE.busy
+    del fetched[:]
+    # The check finishes without touching updatedAt
+    _set_status(api, "SUCCESS", number)
+    menus.capture(github.render)
+    assert fetched == [["PR_%d" % number]]
+    assert not github.SCHEDULE.busy
+
+    del fetched[:]
+    menus.capture(github.render)
+    assert fetched == []
+
+
+def test_searches_follow_cursors_to_the_last_page(api, tmp_path, monkeypatch):
+    github = _plugin(monkeypatch, str(tmp_path / "gh"))
+    api.datasets.github = bench.github_nodes(250)
+    api.datasets.github_by_id = {node["id"]: node for node in api.datasets.github}
+    documents = []
+    execute_query = github.execute_query
+
+    def recorded(query, cached=True):
+        documents.append(query)
+        return execute_query(query, cached)
+
+    github.execute_query = recorded
+    menus.capture(github.render)
+    assert _mine(github) == list(range(250))
+    # Two more pages after the first, and none past the last
+    assert re.findall(r'after: "(\d+)"', "".join(documents)) == ["100", "200"]
+
+
+def test_prs_that_leave_the_search_are_forgotten(api, tmp_path, monkeypatch):
+    github = _plugin(monkeypatch, str(tmp_path / "gh"))
+    menus.capture(github.render)
+    del api.datasets.github[3]
+
+    menus.capture(github.render)
+    assert github.PR_STORE.get("org/repo-3#3") is None
+    assert 3 not in _mine(github)
+
+
+def test_closing_my_pr_drops_it(api, tmp_path, monkeypatch):
+    github = _plugin(monkeypatch, str(tmp_path / "gh"))
+    menus.capture(github.render)
+    fetched = _counting_details(github)
+
+    pull = _pull(3, repo="org/repo-3", state="closed", assignees=[LOGIN])
+    assert github.apply_event("pull_request", {"pull_request": pull})
+    assert 3 not in _mine(github)
+    assert fetched == []
+
+
+def test_change_to_my_pr_refetches_only_it(api, tmp_path, monkeypatch):
+    github = _plugin(monkeypatch, str(tmp_path / "gh"))
+    menus.capture(github.render)
+    fetched = _counting_details(github)
+
+    pull = _pull(3, repo="org/repo-3", assignees=[LOGIN])
+    assert github.apply_event("pull_request", {"pull_request": pull})
+    assert fetched == [["PR_3"]]
+    assert github.PR_STORE.updated_at("org/repo-3#3") == pull["updated_at"]
+
+
+def test_review_patches_the_snapshot(api, tmp_path, monkeypatch):
+    github = _plugin(monkeypatch, str(tmp_path / "gh"))
+    menus.capture(github.render)
+
+    payload = {
+        "pull_request": _pull(1, requested=[LOGIN]),
+        "review": {"user": {"login": LOGIN}, "state": "approved"},
+    }
+    assert github.apply_event("pull_request_review", payload)
+    item = _snapshot_item(github, "org/repo-0", 1)
+    assert item["reviewDecision"] == "APPROVED"
+    assert item["reviewRequests"] == []
+    assert {"author": {"login": LOGIN}, "state": "APPROVED"} in item["latestReviews"]
+
+
+def test_events_about_other_repos_change_nothing(api, tmp_path, monkeypatch):
+    github = _plugin(monkeypatch, str(tmp_path / "gh"))
+    menus.capture(github.render)
+
+    pull = _pull(9, repo="elsewhere/repo")
+    assert not github.apply_event("pull_request", {"pull_request": pull})
+
+
+def test_only_signed_events_are_accepted():
+    body = b'{"zen": "Keep it logically awesome."}'
+    header = webhook.signature("s3cret", body)
+    assert webhook.verified("s3cret", body, header)
+    assert not webhook.verified("other", body, header)
+    assert not webhook.verified("s3cret", body, None)
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import time
+
+from homebar import memo, menus
+
+
+def _days_ago(days):
+    then = datetime.datetime.now() - datetime.timedelta(days=days)
+    return then.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def test_tokens_are_expanded_only_when_shown(capsys):
+    text = "built %s\n" % memo.token("ago", _days_ago(3))
+    assert menus.capture(menus.show, text) == text
+
+    menus.show(text)
+    assert capsys.readouterr().out == "built 3 days ago\n"
+
+
+def test_minutes_left_token():
+    text = memo.token("left", "%d" % (time.time() + 7 * 60))
+    assert memo.expand(text) == "7m"
+
+
+def test_memoized_menu_keeps_its_tokens(tmp_path, capsys):
+    plugin = tmp_path / "plugin.1m.py"
+    plugin.write_text("")
+    memos = memo.Memo(str(plugin))
+    drawn = []
+
+    def draw(date):
+        drawn.append(date)
+        print("built " + memo.token("ago", date))
+
+    for _ in range(2):
+        menus.emit(str(plugin), lambda: memos.render({"n": 1}, draw, _days_ago(2)))
+    assert len(drawn) == 1
+    assert capsys.readouterr().out == "built 2 days ago\n" * 2
+    assert "{{ago:" in menus.read(str(plugin))
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+import pytest
+
+from homebar import client, orchestrate
+
+PLUGIN = "test.1m.py"
+
+
+class RateLimited(client.HTTPError):
+    def __init__(self):
+        super(RateLimited, self).__init__(client.Response(429, {}, b""))
+
+
+def _fails():
+    raise ValueError("no")
+
+
+def test_phases_run_on_what_they_need():
+    results = orchestrate.run(
+        PLUGIN,
+        [
+            orchestrate.Phase("a", lambda: 1),
+            orchestrate.Phase("b", lambda a: a + 1, needs=["a"]),
+        ],
+    )
+    assert (results["a"], results["b"]) == (1, 2)
+    assert results.stale == {}
+
+
+def test_failed_phase_without_last_good_gets_its_default():
+    ran = []
+    results = orchestrate.run(
+        PLUGIN,
+        [
+            orchestrate.Phase("a", _fails, default=[]),
+            orchestrate.Phase("b", ran.append, needs=["a"], default="none"),
+        ],
+    )
+    assert (results["a"], results["b"]) == ([], "none")
+    assert results.stale == {"a": None, "b": None}
+    # Nothing to run it on
+    assert ran == []
+
+
+def test_failed_phase_falls_back_to_last_good():
+    orchestrate.run(PLUGIN, [orchestrate.Phase("a", lambda: [1])])
+    results = orchestrate.run(PLUGIN, [orchestrate.Phase("a", _fails, default=[])])
+    assert results["a"] == [1]
+    assert results.stale["a"] is not None
+
+
+def test_rate_limit_is_raised():
+    orchestrate.run(PLUGIN, [orchestrate.Phase("a", lambda: [1])])
+
+    def limited():
+        raise RateLimited()
+
+    with pytest.raises(RateLimited):
+        orchestrate.run(PLUGIN, [orchestrate.Phase("a", limited)])
+
+
+def test_late_phase_is_stale_by_the_deadline():
+    orchestrate.run(PLUGIN, [orchestrate.Phase("slow", lambda: "earlier")])
+    release = threading.Event()
+
+    def slow():
+        release.wait(10)
+        return "late"
+
+    started = time.monotonic()
+    try:
+        results = orchestrate.run(
+            PLUGIN,
+            [
+                orchestrate.Phase("fast", lambda: "fast"),
+                orchestrate.Phase("slow", slow),
+                orchestrate.Phase("after", lambda s: s + "!", needs=["slow"]),
+            ],
+            deadline=0.5,
+        )
+    finally:
+        release.set()
+    assert time.monotonic() - started < 2
+    assert results["fast"] == "fast"
+    assert results["slow"] == "earlier"
+    assert "fast" not in results.stale
+    assert results.stale["slow"] is not None
+
+
+def test_phases_keeping_progress_dont_drop_each_others_results():
+    def progress():
+        for i in range(200):
+            orchestrate.keep(PLUGIN, slow, i)
+        return 200
+
+    slow = orchestrate.Phase("slow", progress)
+    quick = [orchestrate.Phase("quick_%d" % i, lambda i=i: i) for i in range(10)]
+    orchestrate.run(PLUGIN, [slow] + quick)
+    assert orchestrate.kept(PLUGIN, slow) == 200
+    assert [orchestrate.kept(PLUGIN, phase) for phase in quick] == list(range(10))
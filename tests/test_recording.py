@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+
+from homebar import recording
+
+
+def test_command_key_ignores_where_the_program_lives():
+    assert recording.command_key(
+        ["/usr/local/bin/gh", "pr", "list"]
+    ) == recording.command_key(["/opt/homebrew/bin/gh", "pr", "list"])
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+
+from homebar import daemon, menus, schedule
+
+
+def test_next_run_is_due_an_interval_after_the_last_one_started(tmp_path):
+    plan = schedule.Schedule(str(tmp_path / "plugin.5m.py"))
+
+    def render():
+        time.sleep(0.5)
+        plan.record(["data"])
+
+    started = time.time()
+    plan.run(render)
+    assert plan.state["next_due"] - started < 300.1
+    assert plan.due(started + 300)
+
+
+PLUGIN = """
+from homebar import schedule
+
+SCHEDULE = schedule.Schedule(__file__)
+
+
+def main():
+    SCHEDULE.run(lambda: (print("menu"), SCHEDULE.record(["data"])))
+"""
+
+
+def test_daemon_keeps_a_backed_off_menu_young(tmp_path):
+    path = tmp_path / "plugin.1m.py"
+    path.write_text(PLUGIN)
+    plugin = daemon.Plugin(str(path))
+    plugin.load()
+    resident = daemon.Daemon([plugin])
+    try:
+        resident.refresh(plugin)
+        assert menus.read(str(path)) == "menu\n"
+
+        # Idle for a while, so not due again for four intervals
+        plan = schedule.Schedule(str(path))
+        plan.state["next_due"] = time.time() + 240
+        plan.save()
+        old = time.time() - 200
+        os.utime(menus.menu_path(str(path)), (old, old))
+
+        resident.queue = []
+        started = time.time()
+        resident.refresh(plugin)
+        assert menus.read(str(path), max_age=5) == "menu\n"
+        assert schedule.next_due(str(path)) > started + 200
+        assert resident.queue[0][0] <= started + 61
+    finally:
+        resident.executor.shutdown()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+import subprocess
+import sys
+import threading
+import time
+
+from homebar import menus, singleflight
+
+PLUGIN = "plugin.1m.py"
+
+# A second copy of the plugin, which would render "second"
+SECOND = """
+from homebar import singleflight
+singleflight.run(%r, lambda: print("second"))
+""" % PLUGIN
+
+
+def _second_copy():
+    return subprocess.Popen(
+        [sys.executable, "-c", SECOND],
+        cwd=menus.plugin_directory(),
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    )
+
+
+def _holding(render):
+    """Run ``render`` under the plugin's lock on a thread, once it's taken."""
+    taken = threading.Event()
+
+    def held():
+        taken.set()
+        time.sleep(1)
+        render()
+
+    def run():
+        try:
+            menus.capture(singleflight.run, PLUGIN, held)
+        except ValueError:
+            pass
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    taken.wait()
+    return thread
+
+
+def test_second_copy_waits_for_the_first_ones_menu():
+    first = _holding(lambda: print("first"))
+    second = _second_copy()
+    out, _ = second.communicate(timeout=10)
+    first.join()
+    assert out == "first\n"
+
+
+def test_second_copy_shows_the_last_menu_when_the_first_fails():
+    menus.write(PLUGIN, "last\n")
+
+    def fails():
+        raise ValueError("no")
+
+    first = _holding(fails)
+    second = _second_copy()
+    out, _ = second.communicate(timeout=10)
+    first.join()
+    assert out == "last\n"
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+
+from homebar import bench, client
+
+
+def _issue(key, status="To Do"):
+    return {
+        "key": key,
+        "fields": {
+            "summary": key,
+            "status": {"name": status},
+            "customfield_10600": None,
+        },
+    }
+
+
+def _rewind(story, **seconds):
+    """Move the issue store's sync times back, as if that long had passed."""
+    with open(story.ISSUE_STORE_PATH, "r") as f:
+        state = json.load(f)
+    for name, by in seconds.items():
+        state[name] -= by
+    with open(story.ISSUE_STORE_PATH, "w") as f:
+        json.dump(state, f)
+
+
+def _keys(issues):
+    return sorted(issue["key"] for issue in issues)
+
+
+def test_delta_picks_up_an_issue_assigned_since_the_last_sync(api):
+    story = bench.load_plugin("jira")
+    api.datasets.jira = [_issue("PAY-1"), _issue("PAY-2")]
+    assert _keys(story.sync_issues()) == ["PAY-1", "PAY-2"]
+
+    # Two syncs 30 minutes apart ask for the same "-32m"; the second must
+    # not be answered with the first one's body
+    _rewind(story, synced_at=30 * 60)
+    story.sync_issues()
+    api.datasets.update_issue(_issue("PAY-3"))
+    _rewind(story, synced_at=30 * 60)
+    assert _keys(story.sync_issues()) == ["PAY-1", "PAY-2", "PAY-3"]
+
+
+def test_reconcile_drops_issues_that_stopped_matching(api):
+    story = bench.load_plugin("jira")
+    api.datasets.jira = [_issue("PAY-1"), _issue("PAY-2"), _issue("PAY-3")]
+    story.sync_issues()
+
+    _rewind(story, reconciled_at=2 * story.RECONCILE_SECONDS)
+    story.sync_issues()
+    api.datasets.remove_issue("PAY-2")
+    _rewind(story, reconciled_at=2 * story.RECONCILE_SECONDS)
+    assert _keys(story.sync_issues()) == ["PAY-1", "PAY-3"]
+
+
+def test_stale_first_sync_leaves_the_store_for_next_time(api, monkeypatch):
+    monkeypatch.setattr(client, "BACKOFF", 0)
+    story = bench.load_plugin("jira")
+    api.datasets.jira = [_issue("PAY-1")]
+    story.sync_issues()
+    os.remove(story.ISSUE_STORE_PATH)
+
+    # Past the response cache's ttl with the API down, so it answers with
+    # what it kept
+    directory = story.RESPONSE_CACHE.directory
+    for name in os.listdir(directory):
+        if name.endswith(".json"):
+            path = os.path.join(directory, name)
+            with open(path, "r") as f:
+                entry = json.load(f)
+            entry["stored_at"] -= 2 * story.RESPONSE_CACHE.ttl
+            with open(path, "w") as f:
+                json.dump(entry, f)
+    api.faults["jira"].error_rate = 1
+
+    assert _keys(story.sync_issues()) == ["PAY-1"]
+    assert not os.path.exists(story.ISSUE_STORE_PATH)
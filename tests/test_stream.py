@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import importlib.util
+import os
+import threading
+import time
+
+import pytest
+
+from homebar import menus, stream
+
+
+class Stop(Exception):
+    pass
+
+
+def test_menu_is_printed_only_when_it_changes(capsys):
+    menus = iter(["a", "a", "b"])
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 3:
+            raise Stop()
+
+    with pytest.raises(Stop):
+        stream.run(lambda: print(next(menus)), lambda: -1, sleep=sleep)
+    assert capsys.readouterr().out == "~~~\na\n~~~\nb\n"
+    assert sleeps == [0.0, 0.0, 0.0]
+
+
+def _load(name):
+    path = os.path.join(menus.plugin_directory(), name)
+    spec = importlib.util.spec_from_file_location(name.split(".")[0], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_pomodoro_wakes_as_each_minute_starts(capsys, monkeypatch):
+    pomodoro = _load("pomodoro.1m.py")
+    clock = [datetime.datetime(2021, 3, 1, 10, 0, 15)]
+
+    class Clock(datetime.datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return clock[0]
+
+    monkeypatch.setattr(pomodoro.datetime, "datetime", Clock)
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 3:
+            raise Stop()
+        clock[0] += datetime.timedelta(seconds=seconds)
+
+    with pytest.raises(Stop):
+        stream.run(pomodoro.main, pomodoro.until_next_minute, sleep=sleep)
+    assert sleeps == [45, 60, 60]
+    # The countdown moved on at each wakeup
+    menus_shown = capsys.readouterr().out.split(stream.SEPARATOR + "\n")[1:]
+    assert [text.splitlines()[0] for text in menus_shown] == ["⏳ 30", "⏳ 29", "⏳ 28"]
+
+
+def test_audio_menu_follows_the_device(tmp_path, monkeypatch):
+    device = tmp_path / "device"
+    device.write_text("ATH-M50x\n")
+    monkeypatch.setenv("HOMEBAR_AUDIO_DEVICE_FILE", str(device))
+    audio = _load("audio-source.5s.py")
+    assert isinstance(audio.PROVIDER, audio.DeviceFile)
+    assert menus.capture(audio.main) == "🎧\n---\nATH-M50x\n"
+
+    device.write_text("BenQ GW2480\n")
+    assert menus.capture(audio.main).startswith("🖥\n")
+
+
+def test_audio_wait_returns_when_the_device_changes(tmp_path):
+    device = tmp_path / "device"
+    device.write_text("ATH-M50x\n")
+    audio = _load("audio-source.5s.py")
+    provider = audio.DeviceFile(str(device))
+
+    started = time.monotonic()
+    provider.wait(0.3)
+    assert time.monotonic() - started >= 0.3
+
+    # Rewritten (with a newer mtime) while waiting
+    def switch():
+        time.sleep(0.1)
+        device.write_text("Built-in Output\n")
+        later = time.time() + 1
+        os.utime(str(device), (later, later))
+
+    threading.Thread(target=switch).start()
+    started = time.monotonic()
+    provider.wait(10)
+    assert time.monotonic() - started < 5
+    assert provider.current() == "Built-in Output"